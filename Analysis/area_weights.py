@@ -0,0 +1,42 @@
+import numpy as np
+import xarray as xr
+from Analysis.zonal_stats import build_zone_weights
+from Analysis.valid_pixels import valid_pixel_index, compress
+
+
+def build_area_weights(da, shp):
+    """Flat indices of the pixels inside shp holding data, and their cos(lat) x coverage weights summing to one"""
+    da = da.transpose('time', 'lat', 'lon')
+    coverage, _ = build_zone_weights(shp, da['lat'].values, da['lon'].values)
+    weights = coverage.toarray()[0]
+
+    # Pixels only touched by the boundary carry no data in the clipped cube
+    pixels = valid_pixel_index(da)
+    pixels = pixels[weights[pixels] > 0]
+
+    return {
+        'pixels': pixels,
+        'weights': weights[pixels] / weights[pixels].sum(),
+        'shape': (da.sizes['lat'], da.sizes['lon']),
+    }
+
+
+def area_mean(area_weights, da):
+    """Area-weighted mean over lat/lon of a (time, lat, lon) cube on the grid the weights were built for"""
+    da = da.transpose('time', 'lat', 'lon')
+    if (da.sizes['lat'], da.sizes['lon']) != area_weights['shape']:
+        raise ValueError("Cube grid does not match the area weights")
+
+    flat = compress(da, area_weights['pixels'])['values']
+    weights = area_weights['weights']
+
+    valid = ~np.isnan(flat)
+    if valid.all():
+        mean = flat @ weights
+    else:
+        # Renormalize over the pixels holding data at each step
+        weight = valid @ weights
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(weight > 0, np.where(valid, flat, 0) @ weights / weight, np.nan)
+
+    return xr.DataArray(mean, coords={'time': da['time']}, dims='time', name=da.name)
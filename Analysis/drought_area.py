@@ -0,0 +1,52 @@
+import os
+import numpy as np
+import xarray as xr
+from Analysis.valid_pixels import compress
+
+DROUGHT_AREA_DIR = "Dataset/derived/drought_area"
+
+
+def _class_ids(values, class_edges):
+    # Class of every value (0 .. len(class_edges)), and where a class exists at all
+    valid = ~np.isnan(values)
+    return np.digitize(values, class_edges), valid
+
+
+def class_area_fractions(spi, class_edges, class_names, area_weights):
+    """Area-weighted fraction of the country in each SPI class for every month, as a (time, spi_class) array
+
+    One digitize and one bincount over the (time, valid pixel) SPI values; months are normalized by
+    the weight of the pixels with an SPI value that month."""
+    values = compress(spi, area_weights['pixels'])['values']
+    n_time, n_pixels = values.shape
+    n_classes = len(class_edges) + 1
+
+    classes, valid = _class_ids(values, class_edges)
+    keys = np.arange(n_time)[:, np.newaxis] * n_classes + classes
+    weights = np.broadcast_to(area_weights['weights'], values.shape)
+    area = np.bincount(keys[valid], weights=weights[valid], minlength=n_time * n_classes).reshape(n_time, n_classes)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        fractions = area / area.sum(axis=1, keepdims=True)
+
+    return xr.DataArray(
+        fractions,
+        coords={'time': spi['time'], 'spi_class': class_names},
+        dims=('time', 'spi_class'),
+        name='area_fraction'
+    )
+
+
+def load_class_area_fractions(name, build, source_path):
+    """Class fractions stored as name.nc, read when newer than source_path, else rebuilt with build() and written"""
+    os.makedirs(DROUGHT_AREA_DIR, exist_ok=True)
+    path = os.path.join(DROUGHT_AREA_DIR, f"{name}.nc")
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(source_path):
+        return xr.open_dataarray(path).load()
+
+    # Write beside the target and rename, so an interrupted build never leaves a truncated file;
+    # the temporary name is per process, so workers building at once never share one
+    fractions = build()
+    fractions.to_netcdf(f"{path}.{os.getpid()}.tmp")
+    os.replace(f"{path}.{os.getpid()}.tmp", path)
+    return fractions
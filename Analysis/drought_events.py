@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+from scipy import ndimage
+
+# Months with SPI at or below this value are in drought (moderate drought and worse)
+DROUGHT_THRESHOLD = -1.0
+# Events covering fewer (month, pixel) cells than this are dropped as noise
+MIN_EVENT_CELLS = 20
+# Kilometres per degree of latitude, for the cell areas
+KM_PER_DEGREE = 111.32
+EVENT_COLUMNS = ['onset', 'end', 'duration_months', 'peak_spi', 'peak_date', 'max_area_km2',
+                 'mean_area_km2', 'severity', 'centroid_lat', 'centroid_lon', 'track']
+
+
+def cell_areas(lat, lon):
+    """Area (km²) of the cells of a regular (lat, lon) grid, one value per latitude"""
+    d_lat, d_lon = abs(lat[1] - lat[0]), abs(lon[1] - lon[0])
+    return KM_PER_DEGREE ** 2 * d_lat * d_lon * np.cos(np.deg2rad(lat))
+
+
+def detect_drought_events(spi, threshold=DROUGHT_THRESHOLD, min_cells=MIN_EVENT_CELLS):
+    """Catalog of space-time drought events: regions of SPI <= threshold connected across (time, lat, lon)
+
+    Returns one row per event, ordered by onset, with its centroid track as a list of
+    (date, lat, lon, area km²) tuples, one per month of the event."""
+    spi = spi.transpose('time', 'lat', 'lon')
+    values = spi.values
+    times = pd.DatetimeIndex(spi['time'].values)
+    lat, lon = spi['lat'].values, spi['lon'].values
+
+    # Cells sharing a face in space or time belong to the same event; NaN never joins one
+    labels, n_events = ndimage.label(values <= threshold, structure=ndimage.generate_binary_structure(3, 1))
+    if n_events == 0:
+        return pd.DataFrame(columns=EVENT_COLUMNS)
+
+    t, y, x = np.nonzero(labels)
+    event = labels[t, y, x] - 1
+    area = cell_areas(lat, lon)[y]
+    deficit = -values[t, y, x] * area
+
+    # Area and centroid of every (event, month) slice, from one pass over the drought cells
+    slices, slice_of = np.unique(event * len(times) + t, return_inverse=True)
+    slice_area = np.bincount(slice_of, weights=area)
+    slice_lat = np.bincount(slice_of, weights=area * lat[y]) / slice_area
+    slice_lon = np.bincount(slice_of, weights=area * lon[x]) / slice_area
+    slice_event, slice_month = np.divmod(slices, len(times))
+
+    cells = np.bincount(event, minlength=n_events)
+    months = np.bincount(slice_event, minlength=n_events)
+    # Severity: SPI deficit below zero times area, summed over the event's cells (SPI·km²)
+    severity = np.bincount(event, weights=deficit, minlength=n_events)
+    index = np.arange(1, n_events + 1)
+    peak_spi = ndimage.minimum(values, labels, index)
+    peak_position = ndimage.minimum_position(values, labels, index)
+    extents = ndimage.find_objects(labels)
+
+    # Slices are sorted by event then month, so each event's track is one contiguous run
+    track_starts = np.concatenate([[0], np.cumsum(months)[:-1]])
+    max_area = np.maximum.reduceat(slice_area, track_starts)
+
+    rows = []
+    for i in np.flatnonzero(cells >= min_cells):
+        track = slice(track_starts[i], track_starts[i] + months[i])
+        rows.append({
+            'onset': times[extents[i][0].start],
+            'end': times[extents[i][0].stop - 1],
+            'duration_months': int(months[i]),
+            'peak_spi': float(peak_spi[i]),
+            'peak_date': times[peak_position[i][0]],
+            'max_area_km2': float(max_area[i]),
+            'mean_area_km2': float(slice_area[track].mean()),
+            'severity': float(severity[i]),
+            'centroid_lat': float(np.average(slice_lat[track], weights=slice_area[track])),
+            'centroid_lon': float(np.average(slice_lon[track], weights=slice_area[track])),
+            'track': list(zip(times[slice_month[track]], slice_lat[track], slice_lon[track], slice_area[track])),
+        })
+
+    return pd.DataFrame(rows, columns=EVENT_COLUMNS).sort_values('onset', ignore_index=True)
@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+from Analysis.valid_pixels import compress, regrid
+from Analysis.wet_day_store import WET_DAY_THRESHOLD
+from Analysis.spells import run_lengths
+
+# ETCCDI precipitation indices: name -> (description, units)
+ETCCDI_INDICES = {
+    'Rx1day': ('Maximum 1-day precipitation', 'mm'),
+    'Rx5day': ('Maximum consecutive 5-day precipitation', 'mm'),
+    'SDII': ('Simple daily intensity index', 'mm/day'),
+    'R10mm': ('Days with precipitation >= 10 mm', 'days'),
+    'R20mm': ('Days with precipitation >= 20 mm', 'days'),
+    'CDD': ('Maximum consecutive dry days', 'days'),
+    'CWD': ('Maximum consecutive wet days', 'days'),
+    'R95pTOT': ('Precipitation on very wet days (> 95th percentile)', 'mm'),
+    'R99pTOT': ('Precipitation on extremely wet days (> 99th percentile)', 'mm'),
+    'PRCPTOT': ('Total precipitation on wet days', 'mm'),
+}
+# Base period of the wet-day percentiles used by R95pTOT and R99pTOT (CHIRPS starts in 1981)
+ETCCDI_BASE_PERIOD = ("1981-01-01", "2010-12-31")
+# Pixels processed per pass; bounds the (time, pixel) temporaries of the daily cube
+ETCCDI_CHUNK = 512
+
+
+def _year_starts(time):
+    years = pd.DatetimeIndex(time).year.values
+    unique_years, starts = np.unique(years, return_index=True)
+    return unique_years, starts
+
+
+def _chunk_indices(values, starts, base_rows, wet_threshold):
+    # Every index for one block of pixel columns; rows are days, reductions run per year via reduceat
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values, 0)
+    wet = valid & (values >= wet_threshold)
+    wet_total = np.add.reduceat(np.where(wet, filled, 0), starts, axis=0)
+    wet_days = np.add.reduceat(wet, starts, axis=0)
+
+    # 5-day totals ending on each day; the first four days of the record have no full window
+    cumulative = np.cumsum(filled, axis=0)
+    five_day = np.full(values.shape, np.nan)
+    five_day[4:] = cumulative[4:] - np.vstack([np.zeros((1, values.shape[1])), cumulative[:-5]])
+
+    # Wet-day percentiles per pixel over the base period
+    base_wet = np.where(wet[base_rows], values[base_rows], np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        p95, p99 = np.nanpercentile(base_wet, [95, 99], axis=0)
+        sdii = np.where(wet_days > 0, wet_total / wet_days, np.nan)
+
+    # Runs never carry over from one year into the next
+    dry = valid & (values < wet_threshold)
+
+    indices = {
+        'Rx1day': np.fmax.reduceat(values, starts, axis=0),
+        'Rx5day': np.fmax.reduceat(five_day, starts, axis=0),
+        'SDII': sdii,
+        'R10mm': np.add.reduceat(valid & (values >= 10), starts, axis=0),
+        'R20mm': np.add.reduceat(valid & (values >= 20), starts, axis=0),
+        'CDD': np.maximum.reduceat(run_lengths(dry, starts), starts, axis=0),
+        'CWD': np.maximum.reduceat(run_lengths(wet, starts), starts, axis=0),
+        'R95pTOT': np.add.reduceat(np.where(wet & (values > p95), filled, 0), starts, axis=0),
+        'R99pTOT': np.add.reduceat(np.where(wet & (values > p99), filled, 0), starts, axis=0),
+        'PRCPTOT': wet_total,
+    }
+
+    # A year with no valid day for a pixel has no index value
+    observed = np.add.reduceat(valid, starts, axis=0) > 0
+    return {name: np.where(observed, result, np.nan) for name, result in indices.items()}
+
+
+def compute_etccdi(da, base_period=ETCCDI_BASE_PERIOD, wet_threshold=WET_DAY_THRESHOLD,
+                   chunk=ETCCDI_CHUNK, progress=None):
+    """Yearly ETCCDI precipitation indices for every pixel of a daily (time, lat, lon) cube, as one Dataset"""
+    compact = compress(da)
+    values = compact['values']
+    times = compact['time'].values
+    years, starts = _year_starts(times)
+    base_rows = (times >= np.datetime64(base_period[0])) & (times < np.datetime64(base_period[1]) + np.timedelta64(1, 'D'))
+
+    n_pixels = values.shape[1]
+    results = {name: np.full((len(years), n_pixels), np.nan) for name in ETCCDI_INDICES}
+    for start in range(0, n_pixels, chunk):
+        block = _chunk_indices(values[:, start:start + chunk], starts, base_rows, wet_threshold)
+        for name, result in block.items():
+            results[name][:, start:start + chunk] = result
+        if progress is not None:
+            progress(min(start + chunk, n_pixels), n_pixels)
+
+    time = pd.to_datetime([f"{year}-12-31" for year in years])
+
+    return xr.Dataset({
+        name: regrid(
+            compact,
+            results[name],
+            dims=['time'],
+            coords={'time': time},
+            attrs={'long_name': description, 'units': units}
+        )
+        for name, (description, units) in ETCCDI_INDICES.items()
+    })
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+from Analysis.valid_pixels import compress
+
+
+def build_pixel_major(da):
+    """Space-major copy of the valid pixels of a (time, lat, lon) cube: each pixel's full series is one contiguous row"""
+    compact = compress(da)
+
+    return {
+        'values': np.ascontiguousarray(compact['values'].T, dtype=np.float32),
+        'pixels': compact['pixels'],
+        'time': pd.DatetimeIndex(compact['time'].values),
+        'lat': compact['lat'].values,
+        'lon': compact['lon'].values,
+        'name': compact['name'],
+    }
+
+
+def _nearest_index(axis_values, value):
+    # Nearest cell of a regular (ascending or descending) axis, None where outside it
+    step = axis_values[1] - axis_values[0]
+    index = int(round((value - axis_values[0]) / step))
+    return index if 0 <= index < len(axis_values) else None
+
+
+def pixel_series(pixel_major, lat, lon):
+    """Series of the cell nearest to (lat, lon) and that cell's centre, or None when the cell holds no data"""
+    row = _nearest_index(pixel_major['lat'], lat)
+    col = _nearest_index(pixel_major['lon'], lon)
+    if row is None or col is None:
+        return None
+
+    # Columns are stored in flat grid order, so the cell's row is found by binary search
+    pixels = pixel_major['pixels']
+    flat = row * len(pixel_major['lon']) + col
+    position = np.searchsorted(pixels, flat)
+    if position == len(pixels) or pixels[position] != flat:
+        return None
+
+    series = pd.Series(pixel_major['values'][position], index=pixel_major['time'], name=pixel_major['name'])
+    return series, (float(pixel_major['lat'][row]), float(pixel_major['lon'][col]))
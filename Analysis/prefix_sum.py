@@ -0,0 +1,93 @@
+import os
+import numpy as np
+import pandas as pd
+import xarray as xr
+from Analysis.valid_pixels import compress, regrid
+
+PREFIX_SUM_DIR = "Dataset/derived/prefix_sums"
+# Pixels accumulated per pass; bounds the float64 temporaries of the cumulative sums
+PREFIX_SUM_CHUNK = 1024
+
+
+def build_prefix_sums(dataset, chunk=PREFIX_SUM_CHUNK):
+    """Cumulative precipitation sums along time over the valid pixels, with a leading zero step
+
+    Valid-value counts are only kept when some valid pixel misses a step; otherwise a range's
+    count is its number of steps."""
+    compact = compress(dataset['tp'])
+    values = compact['values']
+    n_time, n_pixels = values.shape
+    has_missing = bool(np.isnan(values).any())
+
+    cumulative_sum = np.zeros((n_time + 1, n_pixels), dtype=np.float64)
+    if has_missing:
+        cumulative_count = np.zeros((n_time + 1, n_pixels), dtype=np.min_scalar_type(n_time))
+    for start in range(0, n_pixels, chunk):
+        block = values[:, start:start + chunk]
+        np.cumsum(np.nan_to_num(block), axis=0, dtype=np.float64, out=cumulative_sum[1:, start:start + chunk])
+        if has_missing:
+            np.cumsum(~np.isnan(block), axis=0, out=cumulative_count[1:, start:start + chunk])
+
+    variables = {
+        'cumulative_tp': (('step', 'pixel'), cumulative_sum),
+        'grid_index': ('pixel', compact['pixels']),
+    }
+    if has_missing:
+        variables['cumulative_count'] = (('step', 'pixel'), cumulative_count)
+
+    coords = dict(compact['coords'], time=compact['time'], lat=compact['lat'], lon=compact['lon'])
+    return xr.Dataset(variables, coords=coords)
+
+
+def load_prefix_sums(dataset, name, source_path):
+    """Prefix sums stored as name.nc, built and written when missing or older than source_path
+
+    The file is opened lazily: a range mean reads only its two steps from disk."""
+    os.makedirs(PREFIX_SUM_DIR, exist_ok=True)
+    path = os.path.join(PREFIX_SUM_DIR, f"{name}.nc")
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(source_path):
+        # Write beside the target and rename, so an interrupted build never leaves a truncated file;
+        # the temporary name is per process, so workers building at once never share one
+        temporary = f"{path}.{os.getpid()}.tmp"
+        build_prefix_sums(dataset).to_netcdf(temporary)
+        os.replace(temporary, path)
+
+    prefix = xr.open_dataset(path, decode_coords='all')
+    prefix['grid_index'].load()
+    return prefix
+
+
+def _range_bounds(prefix, start_date, end_date):
+    # Dates are day-granular, so the end date includes every time step on that day
+    times = prefix['time'].values
+    start = np.datetime64(pd.Timestamp(str(start_date)).normalize())
+    end = np.datetime64(pd.Timestamp(str(end_date)).normalize() + pd.Timedelta(days=1))
+    return np.searchsorted(times, start, side='left'), np.searchsorted(times, end, side='left')
+
+
+def range_mean(prefix, start_date, end_date):
+    """Per-pixel mean precipitation between two dates (inclusive) using two lookups"""
+    i0, i1 = _range_bounds(prefix, start_date, end_date)
+    bounds = prefix['cumulative_tp'].isel(step=[i0, i1]).values
+    total = bounds[1] - bounds[0]
+    if 'cumulative_count' in prefix:
+        counts = prefix['cumulative_count'].isel(step=[i0, i1]).values.astype(np.int64)
+        count = counts[1] - counts[0]
+    else:
+        count = np.full(total.shape, i1 - i0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(count > 0, total / count, np.nan)
+
+    compact = {
+        'pixels': prefix['grid_index'].values,
+        'lat': prefix['lat'],
+        'lon': prefix['lon'],
+        'coords': {name: coord for name, coord in prefix.coords.items() if coord.dims == ()},
+    }
+    return xr.Dataset({'tp': regrid(compact, mean)})
+
+
+def range_mean_difference(prefix, period_a, period_b):
+    """Per-pixel change in mean precipitation from period A to period B, each a (start, end) pair"""
+    return range_mean(prefix, *period_b) - range_mean(prefix, *period_a)
@@ -0,0 +1,98 @@
+import os
+import numpy as np
+import xarray as xr
+
+# Grid spacings (degrees) of the pyramid levels; the first is the native CHIRPS resolution
+PYRAMID_RESOLUTIONS = (0.05, 0.1, 0.25)
+PYRAMID_DIR = "Dataset/derived/pyramid"
+# Bumped whenever stored levels are built differently, so older files are rebuilt rather than reused
+PYRAMID_VERSION = 2
+
+
+def _native_resolution(dataset):
+    return float(abs(dataset['lon'].values[1] - dataset['lon'].values[0]))
+
+
+def mask_to_footprint(obj, footprint):
+    """NaN outside a (lat, lon) footprint for every variable on the grid; other variables are left as they are"""
+    if isinstance(obj, xr.DataArray):
+        return obj.where(footprint)
+    return obj.assign({
+        name: var.where(footprint) for name, var in obj.data_vars.items() if {'lat', 'lon'} <= set(var.dims)
+    })
+
+
+def coarsen_to_resolution(dataset, resolution, footprint=None):
+    """Block-average a cube onto a grid of the given spacing, anchored at the cube's first cell edge
+
+    Cells outside footprint (True where the grid holds data) are left out of the block means."""
+    native = _native_resolution(dataset)
+    factor = int(round(resolution / native))
+    if factor <= 1:
+        return dataset
+    if footprint is not None:
+        dataset = mask_to_footprint(dataset, footprint)
+
+    # Scalar coordinates such as spatial_ref are not averaged; the CRS is written back below
+    coarse = dataset.reset_coords(drop=True).coarsen(lat=factor, lon=factor, boundary='pad').mean(skipna=True)
+
+    # Padded edge blocks would average only the cell centres present, so recompute the centres
+    step = native * factor
+    for dim in ('lat', 'lon'):
+        values = dataset[dim].values
+        direction = 1 if values[-1] >= values[0] else -1
+        edge = values[0] - direction * native / 2
+        coarse[dim] = edge + direction * step * (np.arange(coarse.sizes[dim]) + 0.5)
+        coarse[dim].attrs = dataset[dim].attrs
+
+    for name in coarse.data_vars:
+        coarse[name] = coarse[name].astype(np.float32)
+    coarse.attrs['pyramid_version'] = PYRAMID_VERSION
+    return coarse.rio.write_crs(dataset.rio.crs) if dataset.rio.crs else coarse
+
+
+def _level_path(name, resolution):
+    return os.path.join(PYRAMID_DIR, f"{name}_{resolution:g}deg.nc")
+
+
+def _read_level(path, source_mtime):
+    # A stored level is reused only if it is newer than the source and built by the current code
+    if not os.path.exists(path) or os.path.getmtime(path) < source_mtime:
+        return None
+    level = xr.open_dataset(path, decode_coords='all')
+    if level.attrs.get('pyramid_version') != PYRAMID_VERSION:
+        level.close()
+        return None
+    return level.load()
+
+
+def load_pyramid(dataset, name, source_path, footprint=None):
+    """Pyramid levels {resolution: cube} of a dataset, read from disk when newer than source_path, else rebuilt"""
+    os.makedirs(PYRAMID_DIR, exist_ok=True)
+    source_mtime = os.path.getmtime(source_path)
+
+    # The native level is the dataset itself
+    pyramid = {PYRAMID_RESOLUTIONS[0]: dataset}
+    for resolution in PYRAMID_RESOLUTIONS[1:]:
+        path = _level_path(name, resolution)
+        level = _read_level(path, source_mtime)
+        if level is not None:
+            pyramid[resolution] = level
+            continue
+
+        # Write beside the target and rename, so an interrupted build never leaves a truncated level;
+        # the temporary name is per process, so workers building at once never share one
+        level = coarsen_to_resolution(dataset, resolution, footprint)
+        encoding = {var: dict(level[var].encoding, zlib=True, complevel=4) for var in level.data_vars}
+        level.to_netcdf(f"{path}.{os.getpid()}.tmp", encoding=encoding)
+        os.replace(f"{path}.{os.getpid()}.tmp", path)
+        pyramid[resolution] = level
+
+    return pyramid
+
+
+def pick_level(resolutions, x_span, y_span, width_px, height_px):
+    """Coarsest resolution whose cells are no larger than one displayed pixel (the finest if none is)"""
+    pixel_size = min(x_span / width_px, y_span / height_px)
+    fitting = [resolution for resolution in resolutions if resolution <= pixel_size * (1 + 1e-9)]
+    return max(fitting) if fitting else min(resolutions)
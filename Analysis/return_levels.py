@@ -0,0 +1,90 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import xarray as xr
+from scipy.special import gamma
+from Analysis.valid_pixels import compress, regrid
+
+# Return periods (years) of the return-level maps
+RETURN_PERIODS = (10, 25, 50, 100)
+# Bootstrap resamples for the confidence intervals, and how many are fitted per parallel task
+BOOTSTRAP_SAMPLES = 500
+BOOTSTRAP_CHUNK = 50
+
+
+def gev_lmoments(maxima):
+    """GEV location, scale and shape (Hosking's k) of every column of a (year, pixel) array by L-moments
+
+    Missing years are skipped; columns with fewer than three values get NaN parameters."""
+    maxima = np.sort(np.asarray(maxima, dtype=np.float64), axis=0)  # NaN sorts last
+    n = (~np.isnan(maxima)).sum(axis=0).astype(np.float64)
+    j = np.arange(maxima.shape[0], dtype=np.float64)[:, np.newaxis]  # 0-based rank within the column
+
+    # Unbiased probability-weighted moments b0, b1, b2 over each column's valid values
+    values = np.nan_to_num(maxima)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        b0 = values.sum(axis=0) / n
+        b1 = (values * j / (n - 1)).sum(axis=0) / n
+        b2 = (values * j * (j - 1) / ((n - 1) * (n - 2))).sum(axis=0) / n
+
+        l1, l2, l3 = b0, 2 * b1 - b0, 6 * b2 - 6 * b1 + b0
+        t3 = l3 / l2
+
+        # Hosking (1985) approximation of the shape from the L-skewness
+        c = 2 / (3 + t3) - np.log(2) / np.log(3)
+        k = 7.8590 * c + 2.9554 * c ** 2
+        scale = l2 * k / ((1 - 2.0 ** -k) * gamma(1 + k))
+        location = l1 - scale * (1 - gamma(1 + k)) / k
+
+    invalid = (n < 3) | ~(l2 > 0)
+    return tuple(np.where(invalid, np.nan, param) for param in (location, scale, k))
+
+
+def gev_return_levels(location, scale, k, periods=RETURN_PERIODS):
+    """Return levels (period, pixel) of GEV parameters, for return periods in years"""
+    y = -np.log(1 - 1 / np.asarray(periods, dtype=np.float64))[:, np.newaxis]
+    return location + scale / k * (1 - y ** k)
+
+
+def _bootstrap_levels(maxima, resamples, periods):
+    # Return levels of each resample of years, shared across pixels to keep the fits batched
+    return np.stack([gev_return_levels(*gev_lmoments(maxima[rows]), periods) for rows in resamples])
+
+
+def bootstrap_intervals(maxima, periods=RETURN_PERIODS, samples=BOOTSTRAP_SAMPLES, confidence=0.9,
+                        chunk=BOOTSTRAP_CHUNK, seed=0, workers=None):
+    """Lower and upper bootstrap confidence bounds (2, period, pixel) of the return levels, fitted in parallel chunks"""
+    rng = np.random.default_rng(seed)
+    resamples = rng.integers(0, maxima.shape[0], size=(samples, maxima.shape[0]))
+
+    # numpy releases the GIL in the sorts and reductions, so threads fit chunks side by side
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        levels = np.concatenate(list(pool.map(
+            lambda start: _bootstrap_levels(maxima, resamples[start:start + chunk], periods),
+            range(0, samples, chunk)
+        )))
+
+    alpha = (1 - confidence) / 2
+    return np.nanquantile(levels, [alpha, 1 - alpha], axis=0)
+
+
+def fit_return_levels(annual_maxima, periods=RETURN_PERIODS, confidence=None):
+    """Return-level maps (return_period, lat, lon) of a yearly-maximum cube, with bootstrap bounds when confidence is set"""
+    compact = compress(annual_maxima)
+    maxima = compact['values']
+    location, scale, k = gev_lmoments(maxima)
+
+    variables = {
+        'return_level': regrid(compact, gev_return_levels(location, scale, k, periods),
+                               dims=['return_period'], coords={'return_period': list(periods)},
+                               attrs={'units': 'mm'}),
+        'location': regrid(compact, location),
+        'scale': regrid(compact, scale),
+        'shape': regrid(compact, k, attrs={'description': "Hosking's k (negative for a heavy tail)"}),
+    }
+    if confidence is not None:
+        lower, upper = bootstrap_intervals(maxima, periods, confidence=confidence)
+        for name, bound in (('lower', lower), ('upper', upper)):
+            variables[name] = regrid(compact, bound, dims=['return_period'],
+                                     coords={'return_period': list(periods)}, attrs={'units': 'mm'})
+
+    return xr.Dataset(variables, attrs={'confidence': confidence if confidence is not None else 'none'})
@@ -0,0 +1,33 @@
+import xarray as xr
+from shapely.geometry import mapping
+from Analysis.area_weights import area_mean
+
+
+def build_seasonal_totals(monthly_dataset, seasons, shp, area_weights):
+    """Per-season, per-year precipitation totals (clipped to shp) and their area-weighted mean series"""
+    totals = []
+    for months in seasons.values():
+        season_data = monthly_dataset.sel(time=monthly_dataset['time.month'].isin(months))
+        totals.append(season_data['tp'].resample(time='YE').sum(skipna=True))
+
+    # Years missing from a season (e.g. an incomplete final year) stay NaN after alignment
+    cube = xr.concat(totals, dim='season', join='outer')
+    cube = cube.assign_coords(season=list(seasons.keys()))
+    cube = cube.rio.clip(shp.geometry.apply(mapping), shp.crs, drop=False)
+
+    return xr.Dataset({
+        'tp': cube,
+        'tp_area_mean': xr.concat(
+            [area_mean(area_weights, cube.sel(season=season)) for season in cube['season'].values], dim='season'
+        ).assign_coords(season=cube['season']),
+    })
+
+
+def select_season(seasonal_totals, season, start_year, end_year):
+    """Totals cube and area-mean series of one season for the years start_year..end_year"""
+    selected = seasonal_totals.sel(season=season, drop=True)
+    years = selected['time'].dt.year
+    selected = selected.sel(time=(years >= start_year) & (years <= end_year))
+
+    # Drop years this season has no data for
+    return selected.sel(time=selected['tp_area_mean'].notnull())
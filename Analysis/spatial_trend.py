@@ -1,34 +1,394 @@
+import os
+import warnings
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
+import pandas as pd
 import xarray as xr
-import pymannkendall as mk  
-
-def calculate_spatial_trend(dataset):
-    """Calculate significant spatial trends (p < 0.05)"""
-    da = dataset['tp']
-    lat = da['lat'].values
-    lon = da['lon'].values
-    z = da.values
-
-    slope = np.zeros(z.shape[1:])
-    p_value = np.zeros(z.shape[1:])
-
-    for ilat in range(z.shape[1]):
-        for ilon in range(z.shape[2]):
-            precip_series = z[:, ilat, ilon]
-            
-            if np.isnan(precip_series).all():
-                slope[ilat, ilon] = np.nan
-                p_value[ilat, ilon] = np.nan
-            else:
-                result = mk.original_test(precip_series)
-                slope[ilat, ilon] = result.slope
-                p_value[ilat, ilon] = result.p
-
-    significant_trend = np.where(p_value <= 0.05, slope, np.nan)
-    
-    return xr.DataArray(
-        significant_trend,
-        dims=['lat', 'lon'],
-        coords={'lat': lat, 'lon': lon},
-        attrs={'description': 'Significant trends (p < 0.05)', 'units': 'mm/year'}
-    )
\ No newline at end of file
+from scipy.stats import norm, rankdata
+from Analysis.valid_pixels import compress, regrid
+
+# Upper bound on pairwise slopes held in memory at once by the S and Sen's slope pass
+SEN_CHUNK_ELEMENTS = 10_000_000
+# Stride of the sample that brackets each Sen's slope median before the exact selection
+MEDIAN_SAMPLE_STRIDE = 32
+# Upper bound on rank matrix elements held in memory at once by the Pettitt test
+PETTITT_CHUNK_ELEMENTS = 20_000_000
+# Upper bound on series elements per chunk of the Hamed-Rao autocorrelation step (FFT buffers are twice as long)
+HAMED_RAO_CHUNK_ELEMENTS = 5_000_000
+# Block-bootstrap resamples of the Sen's slope intervals, and the upper bound on resampled elements per batch
+TREND_BOOTSTRAP_SAMPLES = 200
+BOOTSTRAP_CHUNK_ELEMENTS = 20_000_000
+# Processes of the bootstrap pool; the app's other callbacks keep the remaining cores
+BOOTSTRAP_WORKERS = min(2, os.cpu_count() or 1)
+TREND_INTERVAL_DIR = "Dataset/derived/trend_intervals"
+
+# Trend test result with the fields the trend plots read from pymannkendall results
+TrendTest = namedtuple('TrendTest', ['trend', 'p', 'slope'])
+
+
+def _tie_term(values):
+    """Per-column sum of t(t-1)(2t+5) over groups of t tied valid values"""
+    n_time, n_pixels = values.shape
+    ordered = np.sort(values, axis=0)  # NaN sorts last and never joins a group
+
+    new_group = np.ones(ordered.shape, dtype=bool)
+    new_group[1:] = ordered[1:] != ordered[:-1]
+    group = np.cumsum(new_group, axis=0) - 1 + np.arange(n_pixels) * n_time
+
+    t = np.bincount(group[~np.isnan(ordered)], minlength=n_time * n_pixels).astype(np.float64)
+    return (t * (t - 1) * (2 * t + 5)).reshape(n_pixels, n_time).sum(axis=1)
+
+
+def _s_variance(values):
+    """Tie-corrected variance of the Mann-Kendall S and the valid count of every column"""
+    n = (~np.isnan(values)).sum(axis=0).astype(np.float64)
+    return (n * (n - 1) * (2 * n + 5) - _tie_term(values)) / 18, n
+
+
+def _row_medians(rows):
+    """Exact median of every row of a 2-D array, selected within a narrow band around a sampled estimate
+
+    A strided sample brackets each row's median; only the values inside the bracket are partitioned,
+    and rows whose bracket misses the median fall back to a full partition."""
+    n_rows, n = rows.shape
+    ranks = [(n - 1) // 2, n // 2]  # The two middle ranks (equal for an odd count)
+    if n < MEDIAN_SAMPLE_STRIDE ** 2:
+        middle = np.partition(rows, ranks, axis=1)[:, ranks].astype(np.float64)
+        return middle.mean(axis=1)
+
+    # The sample rank of the median varies by about sqrt(m)/2; the bracket spans six of those on each side
+    sample = np.sort(rows[:, ::MEDIAN_SAMPLE_STRIDE], axis=1)
+    m = sample.shape[1]
+    half_width = int(3 * np.sqrt(m)) + 1
+    low = sample[:, max(m // 2 - half_width, 0), np.newaxis]
+    high = sample[:, min(m // 2 + half_width, m - 1), np.newaxis]
+    inside = rows < low
+    below = inside.sum(axis=1)
+    np.logical_not(inside, out=inside)
+    inside &= rows <= high
+    count = inside.sum(axis=1)
+
+    medians = np.empty(n_rows)
+    for r in range(n_rows):
+        if below[r] <= ranks[0] and ranks[1] < below[r] + count[r]:
+            band, offset = rows[r][inside[r]], below[r]
+        else:
+            band, offset = rows[r].copy(), 0
+        band_ranks = [rank - offset for rank in ranks]
+        band.partition(band_ranks)
+        medians[r] = band[band_ranks].astype(np.float64).mean()
+    return medians
+
+
+def _lag_slopes(series, groups):
+    """Valid pairwise slopes of one series, one lag of one group at a time"""
+    for rows in groups:
+        x = series[rows]
+        for k in range(1, len(rows)):
+            lag = (x[k:] - x[:-k]) / k
+            yield lag[~np.isnan(lag)]
+
+
+def _series_pair_statistics(series, groups):
+    """Mann-Kendall S and Sen's slope of a single series without holding all of its pairs
+
+    A first pass over the lags sums S and keeps every MEDIAN_SAMPLE_STRIDE-th slope of the whole
+    sequence (a per-lag stride would over-weight the short long-lag rows); a second pass counts
+    the slopes below the sample's bracket of the median and keeps only those inside it."""
+    s, n_valid, sample = 0, 0, []
+    for lag in _lag_slopes(series, groups):
+        s += int((lag > 0).sum()) - int((lag < 0).sum())
+        sample.append(lag[-n_valid % MEDIAN_SAMPLE_STRIDE::MEDIAN_SAMPLE_STRIDE].copy())  # A view would keep the lag alive
+        n_valid += len(lag)
+    if n_valid == 0:
+        return np.array([0.0]), np.array([np.nan])
+
+    ranks = [(n_valid - 1) // 2, n_valid // 2]
+    sample = np.sort(np.concatenate(sample))
+    m = len(sample)
+    half_width = int(3 * np.sqrt(m)) + 1
+    low, high = sample[max(m // 2 - half_width, 0)], sample[min(m // 2 + half_width, m - 1)]
+
+    below, band = 0, []
+    for lag in _lag_slopes(series, groups):
+        below += int((lag < low).sum())
+        band.append(lag[(lag >= low) & (lag <= high)])
+    band = np.concatenate(band)
+    if not (below <= ranks[0] and ranks[1] < below + len(band)):
+        # The bracket missed the median: select from every slope
+        band, below = np.concatenate(list(_lag_slopes(series, groups))), 0
+    band_ranks = [rank - below for rank in ranks]
+    band.partition(band_ranks)
+    return np.array([float(s)]), np.array([band[band_ranks].mean()])
+
+
+def _pair_statistics(values, groups, progress=None):
+    """Mann-Kendall S and Sen's slope of every column, from one pass over the pairs of time steps within each group
+
+    Pairs are formed one lag at a time into a bounded (pixel, pair) buffer, so no pair index arrays are
+    built. Pairs with a missing value count as zero in S and are left out of the median. A single
+    series streams its pairs instead, since one column of the buffer already holds every pair."""
+    n_pairs = sum(len(rows) * (len(rows) - 1) // 2 for rows in groups)
+    n_pixels = values.shape[1]
+    if n_pixels == 1:
+        return _series_pair_statistics(values[:, 0], groups)
+    s = np.zeros(n_pixels)
+    slope = np.full(n_pixels, np.nan)
+
+    # Over pixel chunks to bound memory
+    n = (~np.isnan(values)).sum(axis=0)
+    columns = np.flatnonzero(n >= 2)
+    step = max(1, SEN_CHUNK_ELEMENTS // max(n_pairs, 1))
+    for start in range(0, len(columns), step):
+        chunk = columns[start:start + step]
+        slopes = np.empty((len(chunk), n_pairs), dtype=np.float32)
+        offset = 0
+        for rows in groups:
+            # The pair buffer is float32 like the source cubes, so differences are taken in float32 too
+            series = np.ascontiguousarray(values[np.ix_(rows, chunk)].T, dtype=np.float32)
+            for k in range(1, len(rows)):
+                lag = slopes[:, offset:offset + len(rows) - k]
+                np.subtract(series[:, k:], series[:, :-k], out=lag)
+                lag /= np.float32(k)
+                offset += len(rows) - k
+
+        s[chunk] = (slopes > 0).sum(axis=1) - (slopes < 0).sum(axis=1)
+        if np.isnan(values[:, chunk]).any():
+            slope[chunk] = np.nanmedian(slopes, axis=1)
+        else:
+            slope[chunk] = _row_medians(slopes)
+        if progress is not None:
+            progress(min(start + step, len(columns)), len(columns))
+    return s, slope
+
+
+def _hamed_rao_correction(values, slope, n, alpha=0.05):
+    """Hamed and Rao (1998) variance correction factor n/n* of every column, from the significant
+    autocorrelations of the ranks of the Sen-detrended series"""
+    n_time, n_pixels = values.shape
+    lag = np.arange(n_time)[:, None]
+    with np.errstate(divide='ignore'):
+        bound = norm.ppf(1 - alpha / 2) / np.sqrt(n)
+    correction = np.ones(n_pixels)
+
+    step = max(1, HAMED_RAO_CHUNK_ELEMENTS // max(n_time, 1))
+    for start in range(0, n_pixels, step):
+        cols = slice(start, start + step)
+        detrended = values[:, cols] - np.arange(1, n_time + 1)[:, None] * slope[cols]
+        ranks = rankdata(detrended, axis=0, nan_policy='omit')
+        centred = np.nan_to_num(ranks - np.nanmean(ranks, axis=0))
+
+        # Autocorrelation at every lag from one FFT per column
+        spectrum = np.fft.rfft(centred, n=2 * n_time, axis=0)
+        acov = np.fft.irfft(spectrum * np.conj(spectrum), n=2 * n_time, axis=0)[:n_time]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            acf = acov / acov[0]
+
+        m = n[cols]
+        significant = (np.abs(acf) > bound[cols]) & (lag >= 1) & (lag <= m - 2)
+        sni = np.where(significant, (m - lag) * (m - lag - 1) * (m - lag - 2) * acf, 0).sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            correction[cols] = np.where(m >= 3, 1 + 2 * sni / (m * (m - 1) * (m - 2)), 1)
+    return correction
+
+
+def mann_kendall_batch(values, progress=None, method='original', seasons=None):
+    """Mann-Kendall p-value and Sen's slope (per time step) for every column of a (time, pixel) array,
+    with missing values skipped. method matches a pymannkendall test:
+      'original'   original_test
+      'seasonal'   seasonal_test, S and variance summed over the seasons labelled by `seasons`
+                   (e.g. calendar months) and slopes taken within each season
+      'hamed_rao'  hamed_rao_modification_test, variance corrected for autocorrelation"""
+    values = np.asarray(values, dtype=np.float64)
+    n_time, n_pixels = values.shape
+
+    if method == 'seasonal':
+        groups = [np.flatnonzero(seasons == season) for season in np.unique(seasons)]
+        var_s, n = np.zeros(n_pixels), np.zeros(n_pixels)
+        for rows in groups:
+            var_season, n_season = _s_variance(values[rows])
+            var_s, n = var_s + var_season, n + n_season
+        s, slope = _pair_statistics(values, groups, progress)
+        # Within-season slopes are per cycle; spread them over the cycle's time steps
+        slope = slope / len(groups)
+    else:
+        var_s, n = _s_variance(values)
+        s, slope = _pair_statistics(values, [np.arange(n_time)], progress)
+        if method == 'hamed_rao':
+            var_s = var_s * _hamed_rao_correction(values, slope, n)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z = np.where(s > 0, (s - 1) / np.sqrt(var_s), np.where(s < 0, (s + 1) / np.sqrt(var_s), 0))
+    p_value = 2 * (1 - norm.cdf(np.abs(z)))
+
+    p_value[n < 2] = np.nan
+    return slope, p_value
+
+
+def trend_test(values, method='original', seasons=None, alpha=0.05):
+    """Trend test of a single series with the batched engine; a (trend, p, slope) tuple like pymannkendall's result"""
+    values = np.asarray(values, dtype=np.float64)
+    slope, p_value = mann_kendall_batch(values[:, None], method=method, seasons=seasons)
+    slope, p_value = float(slope[0]), float(p_value[0])
+
+    if p_value <= alpha:
+        trend = 'increasing' if slope > 0 else 'decreasing' if slope < 0 else 'no trend'
+    else:
+        trend = 'no trend'
+    return TrendTest(trend, p_value, slope)
+
+
+def calculate_spatial_trend(dataset, progress=None, method='original'):
+    """Calculate significant spatial trends (p < 0.05), reporting progress(done, total) per pixel chunk"""
+    # Test only the pixels holding data; the rest of the grid stays NaN
+    compact = compress(dataset['tp'])
+    seasons = compact['time'].dt.month.values if method == 'seasonal' else None
+    slope, p_value = mann_kendall_batch(compact['values'], progress, method, seasons)
+
+    return regrid(
+        compact,
+        np.where(p_value <= 0.05, slope, np.nan),
+        attrs={'description': 'Significant trends (p < 0.05)', 'units': 'mm/year', 'method': method}
+    )
+
+
+# Series shared with the bootstrap workers, set once per worker by _init_bootstrap_worker
+_bootstrap_series = {}
+
+
+def _init_bootstrap_worker(trend, residuals):
+    # Workers receive the series once instead of with every batch
+    _bootstrap_series['trend'] = trend
+    _bootstrap_series['residuals'] = residuals
+
+
+def block_resamples(n_time, block_length, samples, rng):
+    """Moving-block bootstrap time indices (sample, time): runs of block_length consecutive steps from random starts"""
+    n_blocks = -(-n_time // block_length)
+    starts = rng.integers(0, n_time - block_length + 1, size=(samples, n_blocks, 1))
+    return (starts + np.arange(block_length)).reshape(samples, -1)[:, :n_time]
+
+
+def _bootstrap_slopes(seed, samples, block_length):
+    # Sen's slopes (sample, pixel) refitted to the trend plus block-resampled residuals, all resamples in one batch
+    trend, residuals = _bootstrap_series['trend'], _bootstrap_series['residuals']
+    n_time, n_pixels = residuals.shape
+    rows = block_resamples(n_time, block_length, samples, np.random.default_rng(seed))
+    batch = (trend + residuals[rows]).transpose(1, 0, 2).reshape(n_time, samples * n_pixels)
+    return _pair_statistics(batch, [np.arange(n_time)])[1].reshape(samples, n_pixels)
+
+
+def bootstrap_slope_intervals(values, samples=TREND_BOOTSTRAP_SAMPLES, confidence=0.95, block_length=None,
+                              seed=0, workers=BOOTSTRAP_WORKERS, progress=None):
+    """Sen's slope and its moving-block bootstrap confidence bounds for every column of a (time, pixel) array
+
+    Residuals about the Sen's slope line are resampled in blocks, which keeps their autocorrelation, and
+    the slope is refitted to each resample. Batches of resamples run across a process pool, each drawing
+    from its own child of seed, so the bounds do not depend on the number of workers."""
+    values = np.asarray(values, dtype=np.float64)
+    n_time = values.shape[0]
+    if block_length is None:
+        block_length = max(1, round(n_time ** (1 / 3)))
+
+    slope = _pair_statistics(values, [np.arange(n_time)])[1]
+    trend = np.arange(n_time)[:, None] * slope
+    residuals = values - trend
+
+    batch = max(1, BOOTSTRAP_CHUNK_ELEMENTS // max(values.size, 1))
+    sizes = [min(batch, samples - start) for start in range(0, samples, batch)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    slopes = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_bootstrap_worker,
+                             initargs=(trend, residuals)) as pool:
+        futures = [pool.submit(_bootstrap_slopes, child, size, block_length) for child, size in zip(seeds, sizes)]
+        for done, future in enumerate(futures, 1):
+            slopes.append(future.result())
+            if progress is not None:
+                progress(done, len(futures))
+
+    alpha = (1 - confidence) / 2
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)  # Pixels without data have all-NaN resamples
+        lower, upper = np.nanquantile(np.concatenate(slopes), [alpha, 1 - alpha], axis=0)
+    return slope, lower, upper
+
+
+def calculate_trend_intervals(dataset, progress=None, confidence=0.95, samples=TREND_BOOTSTRAP_SAMPLES):
+    """Sen's slope maps with block-bootstrap confidence bounds, their width, and the robustly significant slopes"""
+    compact = compress(dataset['tp'])
+    slope, lower, upper = bootstrap_slope_intervals(compact['values'], samples, confidence, progress=progress)
+    robust = (lower > 0) | (upper < 0)
+
+    return xr.Dataset({
+        'slope': regrid(compact, slope, attrs={'description': "Sen's slope"}),
+        'lower': regrid(compact, lower, attrs={'description': 'Lower confidence bound'}),
+        'upper': regrid(compact, upper, attrs={'description': 'Upper confidence bound'}),
+        'ci_width': regrid(compact, upper - lower, attrs={'description': 'Confidence interval width'}),
+        'robust_slope': regrid(compact, np.where(robust, slope, np.nan),
+                               attrs={'description': 'Slopes whose confidence interval excludes zero'}),
+    }, attrs={'confidence': confidence, 'samples': samples})
+
+
+def load_trend_intervals(dataset, name, source_path, confidence=0.95, samples=TREND_BOOTSTRAP_SAMPLES, progress=None):
+    """Trend intervals of dataset stored under name and their bootstrap settings, read when newer than
+    source_path, else calculated and written"""
+    os.makedirs(TREND_INTERVAL_DIR, exist_ok=True)
+    # The settings are part of the file name, so intervals drawn with other settings are never reused
+    path = os.path.join(TREND_INTERVAL_DIR, f"{name}_c{confidence:g}_n{samples}.nc")
+    if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(source_path):
+        return xr.open_dataset(path).load()
+
+    # Write beside the target and rename, so an interrupted build never leaves a truncated file;
+    # the temporary name is per process, so workers building at once never share one
+    intervals = calculate_trend_intervals(dataset, progress, confidence, samples)
+    intervals.to_netcdf(f"{path}.{os.getpid()}.tmp")
+    os.replace(f"{path}.{os.getpid()}.tmp", path)
+    return intervals
+
+
+def pettitt_batch(values):
+    """Pettitt change point (last index before the shift) and approximate p-value of every column of a
+    (time, pixel) array, from cumulative rank sums; missing values are skipped"""
+    values = np.asarray(values, dtype=np.float64)
+    n_time, n_pixels = values.shape
+    change_point = np.zeros(n_pixels, dtype=np.int64)
+    p_value = np.full(n_pixels, np.nan)
+
+    step = max(1, PETTITT_CHUNK_ELEMENTS // max(n_time, 1))
+    for start in range(0, n_pixels, step):
+        block = values[:, start:start + step]
+        valid = ~np.isnan(block)
+        n = valid.sum(axis=0).astype(np.float64)
+
+        # U_t = 2 * (sum of ranks up to t) - t * (n + 1), with t counting valid values only
+        ranks = np.nan_to_num(rankdata(block, axis=0, nan_policy='omit'))
+        u = 2 * np.cumsum(ranks, axis=0) - np.cumsum(valid, axis=0) * (n + 1)
+        u[~valid] = 0  # Only test splits at observed values
+
+        position = np.argmax(np.abs(u), axis=0)
+        k = np.abs(u[position, np.arange(block.shape[1])])
+        with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+            p = np.minimum(1.0, 2 * np.exp(-6 * k ** 2 / (n ** 3 + n ** 2)))
+
+        change_point[start:start + step] = position
+        p_value[start:start + step] = np.where(n >= 3, p, np.nan)
+
+    return change_point, p_value
+
+
+def calculate_spatial_changepoint(dataset):
+    """Year of the most likely shift (Pettitt test) where significant (p < 0.05), and the p-value map"""
+    compact = compress(dataset['tp'])
+    change_point, p_value = pettitt_batch(compact['values'])
+    change_year = pd.DatetimeIndex(compact['time'].values).year.values[change_point].astype(np.float64)
+
+    return xr.Dataset({
+        'change_year': regrid(
+            compact,
+            np.where(p_value <= 0.05, change_year, np.nan),
+            attrs={'description': 'Year of significant change point (p < 0.05)'}
+        ),
+        'p_value': regrid(compact, p_value, attrs={'description': 'Pettitt test p-value'}),
+    })
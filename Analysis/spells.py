@@ -0,0 +1,165 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+from Analysis.valid_pixels import compress, regrid
+from Analysis.wet_day_store import WET_DAY_THRESHOLD, year_rows, row_entries
+
+# Yearly spell statistics: name -> (description, units)
+SPELL_STATISTICS = {
+    'longest': ('Longest spell', 'days'),
+    'longest_start': ('Start of the longest spell', 'day of year'),
+    'count': ('Number of spells', 'spells'),
+    'mean_length': ('Mean spell length', 'days'),
+}
+# Pixels processed per pass; bounds the (time, pixel) temporaries of the daily cube
+SPELL_CHUNK = 512
+
+
+def run_lengths(condition, starts):
+    """Length of the run of True ending at each step of a (time, pixel) mask, restarting at every index in starts"""
+    count = np.cumsum(condition, axis=0, dtype=np.int32)
+
+    # Count reached before the current run: the step itself where False, the step before a forced restart
+    base = np.where(condition, 0, count)
+    restarts = starts[starts > 0]
+    base[restarts] = count[restarts - 1]
+    np.maximum.accumulate(base, axis=0, out=base)
+    return count - base
+
+
+def spell_ends(condition, starts):
+    """Mask of the last step of every run of True, with runs cut at every index in starts"""
+    ends = condition.copy()
+    ends[:-1] &= ~condition[1:]
+    restarts = starts[starts > 0]
+    ends[restarts - 1] = condition[restarts - 1]
+    return ends
+
+
+def _chunk_spells(condition, starts, min_length):
+    # Spell statistics for one block of pixel columns; rows are days
+    runs = run_lengths(condition, starts)
+    ends = spell_ends(condition, starts) & (runs >= min_length)
+    lengths = np.where(ends, runs, 0)
+
+    count = np.add.reduceat(ends, starts, axis=0)
+    total = np.add.reduceat(lengths, starts, axis=0)
+    longest = np.maximum.reduceat(runs, starts, axis=0)
+
+    # Start (day of year) of each year's longest spell: its last day, less its length, within the year block
+    longest_start = np.empty(longest.shape, dtype=np.float64)
+    bounds = np.append(starts, len(condition))
+    for i, (first, stop) in enumerate(zip(bounds[:-1], bounds[1:])):
+        last_day = np.argmax(runs[first:stop], axis=0)
+        longest_start[i] = last_day - longest[i] + 2
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_length = np.where(count > 0, total / count, np.nan)
+    has_spell = longest >= min_length
+
+    return {
+        'longest': np.where(has_spell, longest, 0),
+        'longest_start': np.where(has_spell, longest_start, np.nan),
+        'count': count,
+        'mean_length': mean_length,
+    }
+
+
+def compute_spells(da, kind='dry', wet_threshold=WET_DAY_THRESHOLD, min_length=1, chunk=SPELL_CHUNK):
+    """Yearly dry or wet spell statistics for every pixel of a daily (time, lat, lon) cube, as one Dataset
+
+    Days below wet_threshold are dry, the rest wet; missing days end a spell of either kind,
+    and spells are cut at year boundaries."""
+    compact = compress(da)
+    values = compact['values']
+    years = pd.DatetimeIndex(compact['time'].values).year.values
+    unique_years, starts = np.unique(years, return_index=True)
+
+    n_pixels = values.shape[1]
+    results = {name: np.full((len(unique_years), n_pixels), np.nan) for name in SPELL_STATISTICS}
+    for start in range(0, n_pixels, chunk):
+        block = values[:, start:start + chunk]
+        valid = ~np.isnan(block)
+        condition = valid & ((block < wet_threshold) if kind == 'dry' else (block >= wet_threshold))
+
+        # A year with no valid day for a pixel has no spell statistics
+        observed = np.add.reduceat(valid, starts, axis=0) > 0
+        for name, result in _chunk_spells(condition, starts, min_length).items():
+            results[name][:, start:start + chunk] = np.where(observed, result, np.nan)
+
+    return _spell_dataset(compact, unique_years, results, kind)
+
+
+def _spell_dataset(compact, years, results, kind):
+    # Yearly (year, pixel) statistics regridded onto the map, one variable per SPELL_STATISTICS entry
+    time = pd.to_datetime([f"{year}-12-31" for year in years])
+    return xr.Dataset({
+        name: regrid(
+            compact,
+            results[name],
+            dims=['time'],
+            coords={'time': time},
+            attrs={'long_name': f"{description} ({kind})", 'units': units}
+        )
+        for name, (description, units) in SPELL_STATISTICS.items()
+    })
+
+
+def store_dry_spells(store, wet_threshold=WET_DAY_THRESHOLD, min_length=1):
+    """Yearly dry spell statistics from the zero-suppressed wet-day store, equal to compute_spells(kind='dry')
+
+    Only the stored days can end a dry spell: wet days and missing (NaN) days break a run, and the
+    unstored zeros between them are dry. Each year's runs are the gaps between its breaks."""
+    matrix = store['matrix']
+    n_pixels = matrix.shape[1]
+    pixel_ids = np.arange(n_pixels)
+    min_length = max(min_length, 1)
+
+    years = []
+    results = {name: [] for name in SPELL_STATISTICS}
+    for year, row_start, row_end in year_rows(store):
+        n_days = row_end - row_start
+        values, pixels = row_entries(store, row_start, row_end)
+        days = np.repeat(np.arange(n_days), np.diff(matrix.indptr[row_start:row_end + 1]))
+        missing = np.isnan(values)
+        breaks = missing | (values >= wet_threshold)
+
+        # Breaks of every pixel in day order, fenced by one before the first day and one after the last
+        break_pixel = np.concatenate([pixels[breaks], pixel_ids, pixel_ids])
+        break_day = np.concatenate([days[breaks], np.full(n_pixels, -1), np.full(n_pixels, n_days)])
+        order = np.lexsort((break_day, break_pixel))
+        break_pixel, break_day = break_pixel[order], break_day[order]
+
+        # Dry run between each pair of consecutive breaks of one pixel; every pixel has at least one
+        same_pixel = break_pixel[1:] == break_pixel[:-1]
+        gap_pixel = break_pixel[:-1][same_pixel]
+        gap = (np.diff(break_day) - 1)[same_pixel]
+        gap_start = break_day[:-1][same_pixel] + 2  # Day of year (1-based) after the break
+
+        longest = np.maximum.reduceat(gap, np.searchsorted(gap_pixel, pixel_ids))
+        spell = gap >= min_length
+        count = np.bincount(gap_pixel[spell], minlength=n_pixels)
+        total = np.bincount(gap_pixel[spell], weights=gap[spell], minlength=n_pixels)
+
+        # The first of a pixel's longest runs, as the dense path's argmax picks
+        is_longest = np.flatnonzero(gap == longest[gap_pixel])
+        _, first = np.unique(gap_pixel[is_longest], return_index=True)
+        longest_start = gap_start[is_longest[first]].astype(np.float64)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_length = np.where(count > 0, total / count, np.nan)
+        has_spell = longest >= min_length
+        yearly = {
+            'longest': np.where(has_spell, longest, 0),
+            'longest_start': np.where(has_spell, longest_start, np.nan),
+            'count': count,
+            'mean_length': mean_length,
+        }
+
+        # A year with no valid day for a pixel has no spell statistics
+        observed = np.bincount(pixels[missing], minlength=n_pixels) < n_days
+        for name, result in yearly.items():
+            results[name].append(np.where(observed, result, np.nan))
+        years.append(year)
+
+    return _spell_dataset(store, years, {name: np.stack(result) for name, result in results.items()}, 'dry')
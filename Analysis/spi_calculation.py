@@ -1,46 +1,85 @@
+import os
 import xarray as xr
 import numpy as np
 from climate_indices import indices, compute
 from functools import partial
 
-def calculate_spi_with_ufunc(monthly_ds, scale):
+SPI_DIR = "Dataset/derived/spi"
+
+def spi_series(precip_series, scale, start_year, end_year):
+    """Gamma SPI of one monthly precipitation series starting in January of start_year, calibrated over
+    start_year..end_year; all-NaN where the series is empty or the fit fails"""
+    if np.isnan(precip_series).all():
+        return np.full_like(precip_series, np.nan)
+
+    try:
+        return np.ma.filled(
+            indices.spi(
+                precip_series,
+                scale=scale,
+                distribution=indices.Distribution.gamma,
+                periodicity=compute.Periodicity.monthly,
+                data_start_year=start_year,
+                calibration_year_initial=start_year,
+                calibration_year_final=end_year
+            ),
+            np.nan
+        )
+    except Exception as e:
+        print(f"SPI calculation error: {str(e)}")
+        return np.full_like(precip_series, np.nan)
+
+
+def calculate_spi_with_ufunc(monthly_ds, scale, progress=None):
     # Extract time information
     time_coords = monthly_ds.time
     start_year = int(time_coords.dt.year[0])
     end_year = int(time_coords.dt.year[-1])
     
-    # Define the core SPI calculation function
-    def _spi_core(precip_series, scale, start_year, end_year):
-        if np.isnan(precip_series).all():
-            return np.full_like(precip_series, np.nan)
-        
-        try:
-            return np.ma.filled(
-                indices.spi(
-                    precip_series,
-                    scale=scale,
-                    distribution=indices.Distribution.gamma,
-                    periodicity=compute.Periodicity.monthly,
-                    data_start_year=start_year,
-                    calibration_year_initial=start_year,
-                    calibration_year_final=end_year
-                ),
-                np.nan
-            )
-        except Exception as e:
-            print(f"SPI calculation error: {str(e)}")
-            return np.full_like(precip_series, np.nan)
-    
-    # Use apply_ufunc for parallel computation
-    spi_array = xr.apply_ufunc(
-        partial(_spi_core, scale=scale, start_year=start_year, end_year=end_year),
-        monthly_ds['tp'],
-        input_core_dims=[['time']],
-        output_core_dims=[['time']],
-        vectorize=True,
-        dask='parallelized',
-        output_dtypes=[np.float64],
-        keep_attrs=True
-    )
+    # Use apply_ufunc one latitude row at a time so progress(done, total) can be reported
+    n_lat = monthly_ds.sizes['lat']
+    rows = []
+    for ilat in range(n_lat):
+        rows.append(xr.apply_ufunc(
+            partial(spi_series, scale=scale, start_year=start_year, end_year=end_year),
+            monthly_ds['tp'].isel(lat=[ilat]),
+            input_core_dims=[['time']],
+            output_core_dims=[['time']],
+            vectorize=True,
+            dask='parallelized',
+            output_dtypes=[np.float64],
+            keep_attrs=True
+        ))
+        if progress is not None:
+            progress(ilat + 1, n_lat)
+    spi_array = xr.concat(rows, dim='lat')
     
     return spi_array.transpose('time', 'lat', 'lon').rename('SPI')
+
+
+def spi_path(scale):
+    return os.path.join(SPI_DIR, f"spi{scale}.nc")
+
+
+def read_spi(scale, source_path):
+    """Stored SPI cube of one timescale, or None when it was not built yet or is older than source_path"""
+    path = spi_path(scale)
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(source_path):
+        return None
+    return xr.open_dataarray(path, decode_coords='all').load()
+
+
+def load_spi(monthly_ds, scale, source_path, progress=None):
+    """SPI cube of one timescale, read from disk when current, else computed once and written for every caller"""
+    spi = read_spi(scale, source_path)
+    if spi is not None:
+        return spi
+
+    # Write beside the target and rename, so an interrupted build never leaves a truncated file;
+    # the process id keeps two jobs building the same scale from sharing a temporary file
+    os.makedirs(SPI_DIR, exist_ok=True)
+    path = spi_path(scale)
+    spi = calculate_spi_with_ufunc(monthly_ds, scale, progress).astype(np.float32)
+    spi.to_netcdf(f"{path}.{os.getpid()}.tmp")
+    os.replace(f"{path}.{os.getpid()}.tmp", path)
+    return spi
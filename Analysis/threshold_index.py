@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+from Analysis.valid_pixels import compress, regrid
+from Analysis.wet_day_store import count_exceedance_days as wet_day_exceedance_days
+
+# Daily precipitation thresholds (mm) covered by the precomputed index
+EXCEEDANCE_BINS = np.concatenate([np.arange(1, 51), np.arange(60, 201, 10), [250, 300]]).astype(float)
+
+
+def build_exceedance_index(dataset, bins=EXCEEDANCE_BINS):
+    """Count, per pixel and year, the days with precipitation >= each bin edge"""
+    # Histogram only the pixels holding data; the rest of the grid counts zero days
+    compact = compress(dataset['tp'])
+    values = compact['values']
+    years = compact['time'].dt.year.values
+    unique_years = np.unique(years)
+    n_bins = len(bins)
+    n_pixels = values.shape[1]
+    pixel_ids = np.arange(n_pixels)
+
+    counts = np.zeros((len(unique_years), n_bins, n_pixels), dtype=np.uint16)
+    for i, year in enumerate(unique_years):
+        block = values[years == year]
+
+        # Number of bin edges at or below each value (NaN counts as below all)
+        bin_ids = np.searchsorted(bins, block, side='right')
+        bin_ids[np.isnan(block)] = 0
+
+        hist = np.bincount(
+            (bin_ids * n_pixels + pixel_ids).ravel(),
+            minlength=(n_bins + 1) * n_pixels
+        ).reshape(n_bins + 1, n_pixels)
+
+        # Days >= bins[k] are the days falling in histogram slots k+1 and above
+        counts[i] = np.cumsum(hist[:0:-1], axis=0)[::-1]
+
+    return regrid(
+        compact,
+        counts,
+        fill_value=0,
+        dims=['time', 'threshold'],
+        coords={
+            'time': pd.to_datetime([f"{year}-12-31" for year in unique_years]),
+            'threshold': bins,
+        },
+        name='tp',
+        attrs={'description': 'Days per year with precipitation >= threshold', 'units': 'days'}
+    )
+
+
+def count_exceedance_days(dataset, threshold):
+    """Yearly count of days with precipitation >= threshold, straight from the daily cube"""
+    binary_mask = xr.where(dataset['tp'] >= threshold, 1, 0)
+    return binary_mask.resample(time='YE').sum(dim=['time'])
+
+
+def exceedance_days(index, threshold, dataset, wet_day_store=None):
+    """Yearly exceedance counts for the years in dataset, read from the index when possible"""
+    bins = index['threshold'].values
+    years = np.unique(dataset['time'].dt.year.values)
+    position = np.searchsorted(bins, threshold)
+    if position == len(bins) or bins[position] != threshold:
+        # Threshold is off the precomputed grid: scan the wet days only, or the full cube
+        if wet_day_store is not None and threshold > 0:
+            return wet_day_exceedance_days(wet_day_store, threshold, years)
+        return count_exceedance_days(dataset, threshold)
+
+    selected = index.isel(threshold=position, drop=True)
+    return selected.sel(time=selected['time'].dt.year.isin(years)).astype(np.int64)
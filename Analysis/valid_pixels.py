@@ -0,0 +1,47 @@
+import numpy as np
+import xarray as xr
+
+
+def valid_pixel_index(da):
+    """Flat (lat, lon) indices of the pixels of a (time, lat, lon) cube that hold data at any time"""
+    values = da.transpose('time', 'lat', 'lon').values
+    return np.flatnonzero(~np.isnan(values).all(axis=0))
+
+
+def compress(da, pixels=None):
+    """Valid-pixel form of a (time, lat, lon) cube: a contiguous (time, n_valid) array plus each column's grid index"""
+    da = da.transpose('time', 'lat', 'lon')
+    if pixels is None:
+        pixels = valid_pixel_index(da)
+
+    return {
+        'values': da.values.reshape(da.sizes['time'], -1)[:, pixels],
+        'pixels': pixels,
+        'time': da['time'],
+        'lat': da['lat'],
+        'lon': da['lon'],
+        # Scalar coordinates such as spatial_ref, so re-gridded results can still be clipped
+        'coords': {name: coord for name, coord in da.coords.items() if coord.dims == ()},
+        'name': da.name,
+    }
+
+
+def regrid(compact, values, fill_value=np.nan, **kwargs):
+    """Scatter per-pixel results (..., n_valid) back onto the grid as a (..., lat, lon) DataArray
+
+    Leading dimensions are named by `dims` and described by `coords` in kwargs, like xr.DataArray."""
+    values = np.asarray(values)
+    lead_shape = values.shape[:-1]
+    n_lat, n_lon = compact['lat'].size, compact['lon'].size
+
+    grid = np.full(lead_shape + (n_lat * n_lon,), fill_value, dtype=np.result_type(values, fill_value))
+    grid[..., compact['pixels']] = values
+
+    coords = dict(compact['coords'], lat=compact['lat'], lon=compact['lon'])
+    coords.update(kwargs.pop('coords', {}))
+    return xr.DataArray(
+        grid.reshape(lead_shape + (n_lat, n_lon)),
+        dims=list(kwargs.pop('dims', [])) + ['lat', 'lon'],
+        coords=coords,
+        **kwargs
+    )
@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from Analysis.valid_pixels import compress, regrid
+
+# Days at or above this many mm count as wet for percentiles and spells (ETCCDI convention)
+WET_DAY_THRESHOLD = 1.0
+
+
+def build_wet_day_store(da):
+    """Zero-suppressed daily cube: a CSR (time, n_valid) matrix holding only the non-zero (and NaN) pixel-days"""
+    compact = compress(da)
+    # NaN != 0, so missing days stay stored explicitly and are never read as dry zeros
+    matrix = sparse.csr_matrix(compact.pop('values').astype(np.float32))
+    return dict(compact, matrix=matrix)
+
+
+def store_nbytes(store):
+    """Bytes held by the sparse matrix, and what the dense float32 (time, n_valid) array would take"""
+    matrix = store['matrix']
+    stored = matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+    return stored, matrix.shape[0] * matrix.shape[1] * np.dtype(np.float32).itemsize
+
+
+def _row_range(store, start_date, end_date):
+    # Dates are day-granular, so the end date includes every time step on that day
+    times = store['time'].values
+    start = np.datetime64(pd.Timestamp(str(start_date)).normalize())
+    end = np.datetime64(pd.Timestamp(str(end_date)).normalize() + pd.Timedelta(days=1))
+    return np.searchsorted(times, start, side='left'), np.searchsorted(times, end, side='left')
+
+
+def year_rows(store):
+    """(year, first row, end row) of every calendar year in the (sorted) time axis"""
+    years = store['time'].dt.year.values
+    unique_years, starts = np.unique(years, return_index=True)
+    return zip(unique_years, starts, np.append(starts[1:], len(years)))
+
+
+def row_entries(store, row_start, row_end):
+    """Stored values and their pixel columns for a block of rows"""
+    matrix = store['matrix']
+    lo, hi = matrix.indptr[row_start], matrix.indptr[row_end]
+    return matrix.data[lo:hi], matrix.indices[lo:hi]
+
+
+def exceedance_counts(store, bins):
+    """Count, per pixel and year, the days with precipitation >= each (positive) bin edge"""
+    if bins[0] <= 0:
+        raise ValueError("Zero-suppressed counts need positive thresholds")
+
+    n_bins, n_pixels = len(bins), store['matrix'].shape[1]
+    years = []
+    counts = []
+    for year, row_start, row_end in year_rows(store):
+        values, pixels = row_entries(store, row_start, row_end)
+        wet = ~np.isnan(values)
+
+        # Unstored zeros fall below every bin, so only the stored values are histogrammed
+        bin_ids = np.searchsorted(bins, values[wet], side='right')
+        hist = np.bincount(bin_ids * n_pixels + pixels[wet], minlength=(n_bins + 1) * n_pixels)
+        hist = hist.reshape(n_bins + 1, n_pixels)
+
+        # Days >= bins[k] are the days falling in histogram slots k+1 and above
+        counts.append(np.cumsum(hist[:0:-1], axis=0)[::-1].astype(np.uint16))
+        years.append(year)
+
+    return regrid(
+        store,
+        np.stack(counts),
+        fill_value=0,
+        dims=['time', 'threshold'],
+        coords={'time': pd.to_datetime([f"{year}-12-31" for year in years]), 'threshold': bins},
+        name='tp',
+        attrs={'description': 'Days per year with precipitation >= threshold', 'units': 'days'}
+    )
+
+
+def count_exceedance_days(store, threshold, years):
+    """Yearly count of days with precipitation >= a positive threshold, for the given years"""
+    if threshold <= 0:
+        raise ValueError("Zero-suppressed counts need a positive threshold")
+
+    n_pixels = store['matrix'].shape[1]
+    years = set(int(year) for year in years)
+    selected = []
+    counts = []
+    for year, row_start, row_end in year_rows(store):
+        if year not in years:
+            continue
+        values, pixels = row_entries(store, row_start, row_end)
+        counts.append(np.bincount(pixels[values >= threshold], minlength=n_pixels))
+        selected.append(year)
+
+    return regrid(
+        store,
+        np.stack(counts) if counts else np.zeros((0, n_pixels), dtype=np.int64),
+        fill_value=0,
+        dims=['time'],
+        coords={'time': pd.to_datetime([f"{year}-12-31" for year in selected])},
+        name='tp'
+    )
+
+
+def wet_day_percentile(store, start_date, end_date, percentile, wet_threshold=WET_DAY_THRESHOLD):
+    """Percentile of all wet-day values (>= wet_threshold) between two dates, pooled over every pixel"""
+    values, _ = row_entries(store, *_row_range(store, start_date, end_date))
+    return np.percentile(values[values >= wet_threshold], percentile)
@@ -0,0 +1,66 @@
+import numpy as np
+import xarray as xr
+from affine import Affine
+from rasterio.features import rasterize
+from scipy import sparse
+
+# Each grid cell is split into this many sub-cells per side to estimate its fractional coverage by a zone
+ZONE_SUPERSAMPLE = 10
+# Time steps reduced per sparse product; bounds the dense temporaries of long daily cubes
+ZONAL_CHUNK = 1024
+
+
+def build_zone_weights(shp, lat, lon, zone_field=None, supersample=ZONE_SUPERSAMPLE):
+    """Sparse (zone, pixel) matrix of coverage fraction x cos(lat) over a regular (lat, lon) grid, and the zone names"""
+    if zone_field is None:
+        zones = shp.dissolve()
+        names = ['All']
+    else:
+        zones = shp.dissolve(by=zone_field).reset_index()
+        names = [str(name) for name in zones[zone_field]]
+
+    n_lat, n_lon = len(lat), len(lon)
+    d_lat, d_lon = abs(lat[1] - lat[0]), abs(lon[1] - lon[0])
+
+    # Rasterize north-up on the sub-cell grid; zone ids start at 1 so 0 means outside every zone
+    top, left = lat.max() + d_lat / 2, lon.min() - d_lon / 2
+    transform = Affine(d_lon / supersample, 0, left, 0, -d_lat / supersample, top)
+    burned = rasterize(
+        ((geometry, zone_id + 1) for zone_id, geometry in enumerate(zones.geometry) if geometry is not None),
+        out_shape=(n_lat * supersample, n_lon * supersample),
+        transform=transform,
+        fill=0,
+        dtype='int32'
+    )
+
+    rows, cols = np.nonzero(burned)
+    pixel_rows = rows // supersample
+    if lat[0] < lat[-1]:
+        pixel_rows = n_lat - 1 - pixel_rows  # The grid itself runs south to north
+    pixels = pixel_rows * n_lon + cols // supersample
+
+    # Sub-cell counts per (zone, pixel) pair give the fractional coverage
+    fractions = sparse.coo_matrix(
+        (np.full(len(pixels), 1.0 / supersample ** 2), (burned[rows, cols] - 1, pixels)),
+        shape=(len(names), n_lat * n_lon)
+    ).tocsr()
+
+    area = np.repeat(np.cos(np.deg2rad(lat)), n_lon)
+    return fractions.multiply(area[np.newaxis, :]).tocsr(), names
+
+
+def zonal_means(weights, names, da, chunk=ZONAL_CHUNK):
+    """Weighted mean of a (time, lat, lon) cube in every zone, skipping NaN pixels; a (time, zone) array"""
+    da = da.transpose('time', 'lat', 'lon')
+    values = da.values.reshape(da.sizes['time'], -1)
+
+    means = np.empty((values.shape[0], weights.shape[0]), dtype=np.float64)
+    for start in range(0, values.shape[0], chunk):
+        block = values[start:start + chunk]
+        valid = ~np.isnan(block)
+        total = weights @ np.where(valid, block, 0).T
+        weight = weights @ valid.T.astype(np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means[start:start + chunk] = np.where(weight > 0, total / weight, np.nan).T
+
+    return xr.DataArray(means, coords={'time': da['time'], 'zone': names}, dims=('time', 'zone'), name=da.name)
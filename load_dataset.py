@@ -4,6 +4,7 @@ from shapely.geometry import mapping
 import numpy as np
 import pandas as pd
 from datetime import datetime
+from Analysis.area_weights import build_area_weights, area_mean
 
 def preprocess():
     # Load original dataset
@@ -44,10 +45,12 @@ def process(dataset):
     dataset=dataset.rio.clip(shp.geometry.apply(mapping), shp.crs,drop= True)
 
     daily_dataset= dataset.copy()
-    monthly_dataset= dataset.resample(time='1ME').sum(dim=['time'], skipna= True)
-    yearly_dataset= dataset.resample(time='1YE').sum(dim=["time"],skipna= True)
+    # min_count keeps pixels outside the border NaN; a plain sum would turn them into zero-rain cells
+    monthly_dataset= dataset.resample(time='1ME').sum(dim=['time'], skipna= True, min_count=1)
+    yearly_dataset= dataset.resample(time='1YE').sum(dim=["time"],skipna= True, min_count=1)
 
-    dataframe=dataset.mean(dim=['lat','lon'], skipna=True).to_dataframe().reset_index()
+    area_weights= build_area_weights(dataset['tp'], shp)
+    dataframe=area_mean(area_weights, dataset['tp']).to_dataframe().reset_index()
     dataframe['year']= dataframe['time'].dt.year
     dataframe['month']= dataframe['time'].dt.month
     dataframe['day']= dataframe['time'].dt.day
@@ -1,24 +1,43 @@
 import dash
-from dash import dcc, html, Input, Output, State, callback_context
+from dash import dcc, html, dash_table, Input, Output, State, Patch, callback_context, DiskcacheManager
+from dash.exceptions import PreventUpdate
 import dash_bootstrap_components as dbc
+import diskcache
 import plotly.graph_objects as go
 import pymannkendall as mk
-import xarray as xr
 import geopandas as gpd
 import rioxarray as rio
 from shapely.geometry import mapping
 from datetime import date, datetime
 import calendar
+import json
+import hashlib
+from flask import abort, make_response, request
 import pandas as pd
 import numpy as np
-from utils.spatial_plot import plot_precipitation_distribution
-from utils.temporal_plot import plot_precipitation_trend
+from utils.spatial_plot import plot_precipitation_distribution, to_typed_array, patch_spatial_figure, plot_tile_map, plot_event_track, MAP_PLOT_AREA
+from utils.temporal_plot import plot_precipitation_trend, plot_pixel_series, plot_class_area, trend_trace, MAX_POINTS
 from climate_indices import indices, compute
-from Analysis.spi_calculation import calculate_spi_with_ufunc
+from Analysis.spi_calculation import load_spi, read_spi, spi_series
 from load_dataset import load_main_dataset, load_hydrological_year_dataset
 from plotly.subplots import make_subplots
-from Analysis.spatial_trend import calculate_spatial_trend
-from utils.spatial_trend_plot import spatial_trend_plot
+from Analysis.spatial_trend import (calculate_spatial_trend, calculate_spatial_changepoint, trend_test,
+                                    load_trend_intervals)
+from Analysis.threshold_index import build_exceedance_index, exceedance_days, EXCEEDANCE_BINS
+from Analysis.prefix_sum import load_prefix_sums, range_mean
+from Analysis.seasonal_totals import build_seasonal_totals, select_season
+from Analysis.pyramid import load_pyramid, pick_level, mask_to_footprint, PYRAMID_RESOLUTIONS
+from Analysis.pixel_series import build_pixel_major, pixel_series
+from Analysis.zonal_stats import build_zone_weights, zonal_means
+from Analysis.area_weights import build_area_weights, area_mean
+from Analysis.wet_day_store import build_wet_day_store, store_nbytes, exceedance_counts, wet_day_percentile
+from Analysis.etccdi import compute_etccdi, ETCCDI_INDICES
+from Analysis.spells import compute_spells, store_dry_spells, SPELL_STATISTICS
+from Analysis.drought_events import detect_drought_events, DROUGHT_THRESHOLD
+from Analysis.drought_area import class_area_fractions, load_class_area_fractions
+from Analysis.return_levels import fit_return_levels, RETURN_PERIODS
+from utils.spatial_trend_plot import spatial_trend_plot, changepoint_plot, trend_interval_plot
+from utils.tiles import render_tile_rgba, encode_png, empty_tile, tile_resolution
 from functools import lru_cache
 import warnings
 import CHIRPS_PREPROCESSING
@@ -45,6 +64,16 @@ def load_cached_data():
     (seasonal_shp, seasonal_daily_dataset, seasonal_monthly_dataset, 
      seasonal_yearly_dataset, seasonal_dataframe, seasonal_min_year, 
      seasonal_max_year, seasonal_min_date, seasonal_max_date) = load_hydrological_year_dataset()
+
+    # Pixels inside the border: the daily cube is NaN everywhere else
+    footprint = daily_dataset['tp'].notnull().any('time')
+
+    # Coarser copies of the main cubes for maps that cannot show every 0.05° pixel
+    pyramids = {
+        freq: load_pyramid(dataset, freq.lower(), CHIRPS_PREPROCESSING.MERGED_FILE, footprint)
+        for freq, dataset in [('Daily', daily_dataset), ('Monthly', monthly_dataset), ('Yearly', yearly_dataset)]
+    }
+
     
     return {
         'shp': shp,
@@ -64,12 +93,142 @@ def load_cached_data():
         'seasonal_min_year': seasonal_min_year,
         'seasonal_max_year': seasonal_max_year,
         'seasonal_min_date': seasonal_min_date,
-        'seasonal_max_date': seasonal_max_date
+        'seasonal_max_date': seasonal_max_date,
+        'footprint': footprint,
+        'pyramids': pyramids,
+        # Derived results are cached per data version, so a fresh download never reuses them
+        'version': os.path.getmtime(CHIRPS_PREPROCESSING.MERGED_FILE)
     }
 
 # Get data at startup
 data = load_cached_data()
 
+# Derived cubes, built on first use and reused for the lifetime of the loaded data
+FREQUENCY_DATASETS = {'Daily': 'daily_dataset', 'Monthly': 'monthly_dataset', 'Yearly': 'yearly_dataset'}
+
+# Keep the daily cube zero-suppressed for the wet-day kernels (exceedance counts, wet-day percentiles, dry spells);
+# set IMPACT_WET_DAY_STORE=0 to run them on the dense cube instead
+USE_WET_DAY_STORE = os.environ.get("IMPACT_WET_DAY_STORE", "1") != "0"
+
+@lru_cache(maxsize=None)
+def get_wet_day_store():
+    """Zero-suppressed daily cube, or None for the dense path when disabled or when it would not be smaller"""
+    if not USE_WET_DAY_STORE:
+        return None
+    store = build_wet_day_store(data['daily_dataset']['tp'])
+    stored, dense = store_nbytes(store)
+    if stored >= dense:
+        # A stored day costs 8 bytes against 4 dense, so half the days or more non-zero is a loss
+        print(f"Wet-day store: {stored / 2**20:.0f} MiB would exceed {dense / 2**20:.0f} MiB dense, using the dense cube")
+        return None
+    print(f"Wet-day store: {stored / 2**20:.0f} MiB for {dense / 2**20:.0f} MiB of dense pixel-days")
+    return store
+
+@lru_cache(maxsize=None)
+def get_exceedance_index():
+    store = get_wet_day_store()
+    if store is not None:
+        return exceedance_counts(store, EXCEEDANCE_BINS)
+    return build_exceedance_index(data['daily_dataset'])
+
+@lru_cache(maxsize=None)
+def get_etccdi_indices():
+    return compute_etccdi(data['daily_dataset']['tp'])
+
+@lru_cache(maxsize=None)
+def get_spell_statistics(kind):
+    # Dry spells are the gaps between stored days, so they run on the wet-day store; wet spells need the dry zeros
+    store = get_wet_day_store()
+    if kind == 'dry' and store is not None:
+        return store_dry_spells(store)
+    return compute_spells(data['daily_dataset']['tp'], kind)
+
+@lru_cache(maxsize=None)
+def get_return_levels(confidence, version):
+    # Annual maxima of complete years only; a partial final year would bias the fit low
+    annual_maxima = get_etccdi_indices()['Rx1day']
+    if not pd.Timestamp(data['max_date']).is_year_end:
+        annual_maxima = annual_maxima.isel(time=slice(None, -1))
+    return fit_return_levels(annual_maxima, confidence=confidence)
+
+@lru_cache(maxsize=None)
+def get_map_level(freq):
+    """Coarsest pyramid resolution that still fills the plot area of a map figure"""
+    dataset = data[FREQUENCY_DATASETS[freq]]
+    x_span = float(dataset['lon'].max() - dataset['lon'].min())
+    y_span = float(dataset['lat'].max() - dataset['lat'].min())
+    return pick_level(PYRAMID_RESOLUTIONS, x_span, y_span, *MAP_PLOT_AREA)
+
+@lru_cache(maxsize=None)
+def get_prefix_sums(freq, resolution=PYRAMID_RESOLUTIONS[0]):
+    # Built (or opened from disk) on the first date-range mean at this level, not at worker boot: the native
+    # daily level alone is a float64 value per valid pixel-day. Range means then read only two steps of it
+    level = data['pyramids'][freq][resolution]
+    return load_prefix_sums(level, f"{freq.lower()}_{resolution:g}deg", CHIRPS_PREPROCESSING.MERGED_FILE)
+
+@lru_cache(maxsize=None)
+def get_area_weights():
+    # The monthly and yearly cubes share the daily grid and its NaN footprint
+    return build_area_weights(data['daily_dataset']['tp'], data['shp'])
+
+@lru_cache(maxsize=None)
+def get_area_mean_series(freq):
+    return area_mean(get_area_weights(), data[FREQUENCY_DATASETS[freq]]['tp']).to_series().rename('tp')
+
+@lru_cache(maxsize=None)
+def get_pixel_major(freq):
+    return build_pixel_major(data[FREQUENCY_DATASETS[freq]]['tp'])
+
+# Polygon layers for zonal statistics: name -> (shapefile, attribute naming each zone, or None for one zone)
+ZONE_LAYERS = {
+    'Nepal': ('Shapefile/Nepal_bnd_WGS84.shp', None),
+}
+
+@lru_cache(maxsize=None)
+def get_zone_weights(layer, version):
+    path, zone_field = ZONE_LAYERS[layer]
+    grid = data['daily_dataset']
+    shp = gpd.read_file(path).to_crs(grid.rio.crs)
+    return build_zone_weights(shp, grid['lat'].values, grid['lon'].values, zone_field)
+
+@lru_cache(maxsize=None)
+def get_zonal_means(layer, freq, version):
+    weights, names = get_zone_weights(layer, version)
+    return zonal_means(weights, names, data[FREQUENCY_DATASETS[freq]]['tp'])
+
+def zone_options():
+    return [
+        {'label': f"{layer}: {name}", 'value': f"{layer}/{name}"}
+        for layer in ZONE_LAYERS
+        for name in get_zone_weights(layer, data['version'])[1]
+    ]
+
+def get_temporal_series(freq, zone=None):
+    """Area-mean series of the whole grid, or of one 'layer/zone' from ZONE_LAYERS"""
+    if not zone:
+        return get_area_mean_series(freq)
+    layer, _, name = zone.partition('/')
+    return get_zonal_means(layer, freq, data['version']).sel(zone=name).to_series().rename('tp')
+
+@lru_cache(maxsize=None)
+def get_seasonal_totals():
+    return build_seasonal_totals(data['seasonal_monthly_dataset'], seasons, data['shp'], get_area_weights())
+
+# Trend maps are first drawn on a grid this many times coarser, then replaced by the full-resolution result
+PREVIEW_COARSEN = 4
+
+def coarsen_preview(obj):
+    # Outside-border cells are masked first so they never pull the edge blocks towards zero
+    return mask_to_footprint(obj, data['footprint']).coarsen(lat=PREVIEW_COARSEN, lon=PREVIEW_COARSEN, boundary='trim').mean()
+
+@lru_cache(maxsize=None)
+def get_preview_dataset(freq):
+    return coarsen_preview(data[FREQUENCY_DATASETS[freq]])
+
+@lru_cache(maxsize=None)
+def get_preview_seasonal_totals():
+    return coarsen_preview(get_seasonal_totals())
+
 min_year = data['min_year']
 max_year = data['max_year']
 min_date = data['min_date']
@@ -101,9 +260,76 @@ SPI_CLASSES = [
     [2.0, float('inf'), "Exceptionally Wet"]
 ]
 
+# SPI map colours from exceptional drought to exceptionally wet, over SPI_RANGE
+SPI_COLORSCALE = (
+    (0.00, "#730000"), (0.12, "#E60000"),
+    (0.25, "#FFAA00"), (0.37, "#FCD37F"),
+    (0.50, "#FFFFFF"), (0.62, "#9AECFF"),
+    (0.75, "#00AFFF"), (0.87, "#0064C8"),
+    (1.00, "#0000FF")
+)
+SPI_RANGE = (-2.5, 2.5)
+
+def spi_class_colorscale():
+    """Stepped SPI_COLORSCALE: one flat colour per SPI_CLASSES band over SPI_RANGE, and the band midpoints for colorbar ticks"""
+    low, high = SPI_RANGE
+    stops, midpoints = [], []
+    for (lower, upper, _), (_, color) in zip(SPI_CLASSES, SPI_COLORSCALE):
+        lower, upper = max(lower, low), min(upper, high)
+        stops += [[(lower - low) / (high - low), color], [(upper - low) / (high - low), color]]
+        midpoints.append((lower + upper) / 2)
+    return stops, midpoints
+
+# Slope units of the temporal trend maps
+TREND_TIME_UNITS = {
+    'Daily': 'day',
+    'Monthly': 'month',
+    'Yearly': 'year'
+}
+
+# Temporal map types drawn by the background trend job: significant slopes, bootstrap CI width, robust slopes
+TREND_MAP_TYPES = ('trend', 'trend_ci', 'trend_robust')
+# Sen's slope compares every pair of time steps, which a daily record has far too many of
+TREND_FREQUENCIES = ('Monthly', 'Yearly')
+# The CI width and robust maps refit every pixel to hundreds of bootstrap resamples, affordable on yearly data only
+TREND_INTERVAL_TYPES = ('trend_ci', 'trend_robust')
+TREND_INTERVAL_FREQUENCIES = ('Yearly',)
+
+# Trend tests of the batched engine
+TREND_METHOD_OPTIONS = [
+    {'label': 'Mann-Kendall', 'value': 'original'},
+    {'label': 'Seasonal (monthly data)', 'value': 'seasonal'},
+    {'label': 'Hamed-Rao (autocorrelation)', 'value': 'hamed_rao'}
+]
+# Heading of the trend plot annotation for each test
+TREND_TEST_NAMES = {
+    'original': 'Mann-Kendall Test',
+    'seasonal': 'Seasonal Mann-Kendall Test',
+    'hamed_rao': 'Hamed-Rao Modified Mann-Kendall Test'
+}
+
+def trend_method(method, freq):
+    """Trend test for a frequency: the seasonal test needs calendar months, so other frequencies fall back to the original test"""
+    if method == 'seasonal' and freq != 'Monthly':
+        return 'original'
+    return method or 'original'
+
+# Temporal trend trace labels (shared by the full figure and zoom refinements)
+TEMPORAL_TREND_LEGEND = 'Average Precipitation'
+TEMPORAL_TREND_HOVERTEMPLATE = '<b>Year</b>: %{x}<br><b>Average Precipitation</b>: %{y:.1f} mm<extra></extra>'
+
+# Trend and SPI maps run as background jobs so they can report progress and be cancelled
+background_cache = diskcache.Cache("./cache-directory")
+background_callback_manager = DiskcacheManager(background_cache)
+
+def job_progress(set_progress):
+    """Adapt a background callback's set_progress to the (done, total) progress hook of the analysis kernels"""
+    return lambda done, total: set_progress((done, total))
+
 # Initialize the Dash app with optimized settings
 app = dash.Dash(
     __name__,
+    background_callback_manager=background_callback_manager,
     external_stylesheets=[
         dbc.themes.LUX,
         "https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0/css/all.min.css",
@@ -121,6 +347,65 @@ app = dash.Dash(
 
 server = app.server
 
+# Map tiles: /tiles/<layer>/<period>/<z>/<x>/<y>.png, where layer is
+#   precipitation-<daily|monthly|yearly>  period YYYY-MM-DD_YYYY-MM-DD, mean precipitation
+# Tiles are rendered in the request thread, so they only read precomputed data and never start a computation
+TILE_MAX_AGE = 3600
+
+# SPI timescales (months) offered by the SPI pages
+SPI_SCALES = (3, 6, 12, 24)
+
+def get_spi_cube(scale, progress=None):
+    # Computed once per timescale and shared through Dataset/derived/spi by every SPI view
+    return load_spi(data['monthly_dataset'], scale, CHIRPS_PREPROCESSING.MERGED_FILE, progress)
+
+def clip_to_nepal(grid, **kwargs):
+    return grid.rio.clip(data['shp'].geometry.apply(mapping), data['shp'].crs, drop=False, **kwargs)
+
+@lru_cache(maxsize=64)
+def get_tile_layer(layer, period, resolution=PYRAMID_RESOLUTIONS[0]):
+    """Grid and colour range of one tile layer; raises ValueError for unknown layers and periods"""
+    kind, _, variant = layer.partition('-')
+    freq = variant.capitalize()
+    start_date, end_date = (pd.Timestamp(bound).date() for bound in period.split('_'))
+    if freq not in FREQUENCY_DATASETS or start_date > end_date:
+        raise ValueError(f"Unknown tile layer {layer}/{period}")
+
+    if kind == 'precipitation':
+        grid = clip_to_nepal(range_mean(get_prefix_sums(freq, resolution), start_date, end_date)['tp'])
+        # Every zoom level shares the colour range of the native grid
+        native = grid if resolution == PYRAMID_RESOLUTIONS[0] else get_tile_layer(layer, period)['grid']
+        return {'grid': grid, 'colorscale': 'YlGnBu',
+                'range': (float(np.nanmin(native)), float(np.nanmax(native)))}
+
+    raise ValueError(f"Unknown tile layer {layer}")
+
+@lru_cache(maxsize=4096)
+def render_layer_tile(layer, period, z, x, y):
+    if not (0 <= z <= 22 and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise ValueError(f"Tile {z}/{x}/{y} out of range")
+
+    pixel = tile_resolution(z)
+    tile_layer = get_tile_layer(layer, period, pick_level(PYRAMID_RESOLUTIONS, pixel, pixel, 1, 1))
+    grid = tile_layer['grid']
+    rgba = render_tile_rgba(grid.values, grid['lat'].values, grid['lon'].values, z, x, y,
+                            tile_layer['colorscale'], *tile_layer['range'])
+    return encode_png(rgba) if rgba[..., 3].any() else empty_tile()
+
+@server.route('/tiles/<layer>/<period>/<int:z>/<int:x>/<int:y>.png')
+def serve_tile(layer, period, z, x, y):
+    try:
+        png = render_layer_tile(layer, period, z, x, y)
+    except (KeyError, ValueError):
+        abort(404)
+
+    response = make_response(png)
+    response.mimetype = 'image/png'
+    response.set_etag(hashlib.md5(png).hexdigest())
+    response.cache_control.public = True
+    response.cache_control.max_age = TILE_MAX_AGE
+    return response.make_conditional(request)
+
 
 
 # Enhanced custom CSS styles
@@ -915,28 +1200,36 @@ home_layout = html.Div(
 # =============================================================================
 # CALLBACKS
 # =============================================================================
-# Callbacks for modals
-@app.callback(
+# Callbacks for modals (run in the browser, they only flip UI state)
+app.clientside_callback(
+    """
+    function(n1, n2, is_open) {
+        if (n1 || n2) {
+            return !is_open;
+        }
+        return is_open;
+    }
+    """,
     Output("ppt-modal", "is_open"),
     [Input("ppt-btn", "n_clicks"),
      Input("close-ppt-modal", "n_clicks")],
     [State("ppt-modal", "is_open")],
 )
-def toggle_ppt_modal(n1, n2, is_open):
-    if n1 or n2:
-        return not is_open
-    return is_open
 
-@app.callback(
+app.clientside_callback(
+    """
+    function(n1, n2, is_open) {
+        if (n1 || n2) {
+            return !is_open;
+        }
+        return is_open;
+    }
+    """,
     Output("drought-modal", "is_open"),
     [Input("drought-btn", "n_clicks"),
      Input("close-drought-modal", "n_clicks")],
     [State("drought-modal", "is_open")],
 )
-def toggle_drought_modal(n1, n2, is_open):
-    if n1 or n2:
-        return not is_open
-    return is_open
 # Precipitation Analysis Layout (container for the tabs)
 precipitation_layout = html.Div([
     # Loading spinner for smoother transitions
@@ -1009,6 +1302,8 @@ seasonal_layout = html.Div([
             ),
             ##
 
+            dbc.Progress(id='seasonal-trend-progress', value=0, max=1, striped=True, animated=True,
+                         style={'display': 'none'}, className="mb-2"),
             dcc.Graph(id='seasonal-spatial-plot'),  # First graph (full width)
             html.Br(),  # Optional: Adds a small gap between graphs
             dcc.Graph(id='seasonal-temporal-plot')   # Second graph (full width)
@@ -1037,6 +1332,15 @@ temporal_layout = html.Div([
                         value='Monthly',
                         className="mb-3"
                     )
+                ], width=4),
+                dbc.Col([
+                    html.Label("Area:", style=CUSTOM_STYLES["control-label"]),
+                    dcc.Dropdown(
+                        id='temporal-zone-selector',
+                        options=zone_options(),
+                        placeholder="Whole grid",
+                        className="mb-3"
+                    )
                 ], width=4)
             ]),
             
@@ -1150,13 +1454,28 @@ temporal_layout = html.Div([
                 id='temporal-trend-plot-selector',
                 options=[
                     {'label':'Spatial Distribution','value':'distribution'},
-                    {'label': 'Spatial Trend', 'value': 'trend'}
+                    {'label': 'Spatial Trend', 'value': 'trend'},
+                    {'label': 'Trend CI Width', 'value': 'trend_ci'},
+                    {'label': 'Robust Trend', 'value': 'trend_robust'},
+                    {'label': 'Change Point', 'value': 'changepoint'},
+                    {'label': 'Interactive Map', 'value': 'tiles'}
                 ],
             value='distribution',
             inline=True,
             style={'margin-bottom':'10px'}
             ),
-            dcc.Graph(id='temporal-spatial-plot')
+            dbc.RadioItems(
+                id='temporal-trend-method',
+                options=TREND_METHOD_OPTIONS,
+                value='original',
+                inline=True,
+                style={'margin-bottom':'10px'}
+            ),
+            dbc.Progress(id='temporal-trend-progress', value=0, max=1, striped=True, animated=True,
+                         style={'display': 'none'}, className="mb-2"),
+            dcc.Graph(id='temporal-spatial-plot'),
+            dcc.Graph(id='temporal-tile-map', style={'display': 'none'}),
+            dcc.Graph(id='temporal-pixel-plot', style={'display': 'none'})
         ]),
         style=CUSTOM_STYLES["card"]
     ),
@@ -1183,7 +1502,10 @@ indices_layout = html.Div([
                         id='indices-type-selector',
                         options=[
                             {'label': 'Threshold based', 'value': 'threshold'},
-                            {'label': 'Quantile based', 'value': 'quantile'}
+                            {'label': 'Quantile based', 'value': 'quantile'},
+                            {'label': 'ETCCDI indices', 'value': 'etccdi'},
+                            {'label': 'Dry/wet spells', 'value': 'spells'},
+                            {'label': 'Return levels', 'value': 'return'}
                         ],
                         value='threshold',
                         className="mb-3"
@@ -1234,6 +1556,92 @@ indices_layout = html.Div([
                 ]),
                 id='quantile-controls',
                 style={'display': 'none'}
+            ),
+
+            html.Div(
+                dbc.Row([
+                    dbc.Col([
+                        html.Label("Index:", style=CUSTOM_STYLES["control-label"]),
+                        dcc.Dropdown(
+                            id='etccdi-index-selector',
+                            options=[{'label': f'{name}: {description}', 'value': name}
+                                     for name, (description, _) in ETCCDI_INDICES.items()],
+                            value='Rx1day',
+                            className="mb-3"
+                        )
+                    ], width=6),
+                    dbc.Col([
+                        html.Label("Year Range:", style=CUSTOM_STYLES["control-label"]),
+                        dcc.RangeSlider(
+                            id='etccdi-year-range-slider',
+                            min=min_year,
+                            max=max_year,
+                            value=[min_year, max_year],
+                            marks={str(year): str(year) for year in range(min_year, max_year+1, 5)},
+                            step=1,
+                            tooltip={"placement": "bottom", "always_visible": True},
+                            className="p-3"
+                        )
+                    ], width=6)
+                ]),
+                id='etccdi-controls',
+                style={'display': 'none'}
+            ),
+
+            html.Div(
+                dbc.Row([
+                    dbc.Col([
+                        html.Label("Spell Statistic:", style=CUSTOM_STYLES["control-label"]),
+                        dcc.Dropdown(
+                            id='spell-index-selector',
+                            options=[{'label': f'{description} ({kind})', 'value': f'{kind}/{name}'}
+                                     for kind in ('dry', 'wet')
+                                     for name, (description, _) in SPELL_STATISTICS.items()],
+                            value='dry/longest',
+                            className="mb-3"
+                        )
+                    ], width=6),
+                    dbc.Col([
+                        html.Label("Year Range:", style=CUSTOM_STYLES["control-label"]),
+                        dcc.RangeSlider(
+                            id='spell-year-range-slider',
+                            min=min_year,
+                            max=max_year,
+                            value=[min_year, max_year],
+                            marks={str(year): str(year) for year in range(min_year, max_year+1, 5)},
+                            step=1,
+                            tooltip={"placement": "bottom", "always_visible": True},
+                            className="p-3"
+                        )
+                    ], width=6)
+                ]),
+                id='spell-controls',
+                style={'display': 'none'}
+            ),
+
+            html.Div(
+                dbc.Row([
+                    dbc.Col([
+                        html.Label("Return Period:", style=CUSTOM_STYLES["control-label"]),
+                        dcc.Dropdown(
+                            id='return-period-selector',
+                            options=[{'label': f'{period}-year', 'value': period} for period in RETURN_PERIODS],
+                            value=RETURN_PERIODS[0],
+                            className="mb-3"
+                        )
+                    ], width=6),
+                    dbc.Col([
+                        dbc.Checklist(
+                            id='return-ci-toggle',
+                            options=[{'label': '90% bootstrap confidence interval', 'value': 'ci'}],
+                            value=[],
+                            switch=True,
+                            className="mt-4"
+                        )
+                    ], width=6)
+                ]),
+                id='return-controls',
+                style={'display': 'none'}
             )
         ]),
         style=CUSTOM_STYLES["card"]
@@ -1251,6 +1659,8 @@ indices_layout = html.Div([
                 style={'margin-bottom': '10px'}
             ),
 
+            dbc.Progress(id='indices-trend-progress', value=0, max=1, striped=True, animated=True,
+                         style={'display': 'none'}, className="mb-2"),
             dcc.Graph(id='indices-spatial-plot')
         ]),
         style=CUSTOM_STYLES["card"]
@@ -1275,7 +1685,7 @@ spi_layout = html.Div([
                     html.Label("Select SPI Type:", style=CUSTOM_STYLES["control-label"]),  # Fixed: Changed 'label' to 'Label' and 'elect' to 'Select'
                     dcc.Dropdown(
                         id='spi-selector',
-                        options=[{'label': str(spi), 'value': spi} for spi in [3,6,12,24]],  # Fixed: Added proper dropdown options format
+                        options=[{'label': str(spi), 'value': spi} for spi in SPI_SCALES],
                         value=3,
                         className="mb-3"
                     )
@@ -1305,7 +1715,52 @@ spi_layout = html.Div([
     ),
     dbc.Card(
         dbc.CardBody([
+            dbc.Progress(id='spi-progress', value=0, max=1, striped=True, animated=True,
+                         style={'display': 'none'}, className="mb-2"),
             dcc.Graph(id='spi-spatial-plot') ,
+            dcc.Graph(id='spi-pixel-plot', style={'display': 'none'})
+        ]),
+        style=CUSTOM_STYLES["card"]
+    ),
+    dbc.Card(
+        dbc.CardBody([
+            html.H4("Drought Events", style=CUSTOM_STYLES["subtitle"]),
+            html.P(f"Regions with SPI ≤ {DROUGHT_THRESHOLD} connected in space and time, for the selected SPI type. "
+                   "Select an event to see its centroid track."),
+            dbc.Progress(id='drought-events-progress', value=0, max=1, striped=True, animated=True,
+                         style={'display': 'none'}, className="mb-2"),
+            dash_table.DataTable(
+                id='drought-event-table',
+                columns=[
+                    {'name': 'Onset', 'id': 'onset'},
+                    {'name': 'End', 'id': 'end'},
+                    {'name': 'Duration (months)', 'id': 'duration_months', 'type': 'numeric'},
+                    {'name': 'Peak SPI', 'id': 'peak_spi', 'type': 'numeric', 'format': {'specifier': '.2f'}},
+                    {'name': 'Peak Month', 'id': 'peak_date'},
+                    {'name': 'Max Area (km²)', 'id': 'max_area_km2', 'type': 'numeric', 'format': {'specifier': ',.0f'}},
+                    {'name': 'Mean Area (km²)', 'id': 'mean_area_km2', 'type': 'numeric', 'format': {'specifier': ',.0f'}},
+                    {'name': 'Severity (SPI·km²)', 'id': 'severity', 'type': 'numeric', 'format': {'specifier': ',.0f'}},
+                    {'name': 'Centroid Lat', 'id': 'centroid_lat', 'type': 'numeric', 'format': {'specifier': '.2f'}},
+                    {'name': 'Centroid Lon', 'id': 'centroid_lon', 'type': 'numeric', 'format': {'specifier': '.2f'}}
+                ],
+                data=[],
+                page_size=10,
+                sort_action='native',
+                filter_action='native',
+                row_selectable='single',
+                style_header={'backgroundColor': '#3498db', 'color': 'white', 'fontWeight': 'bold'},
+                style_cell={'textAlign': 'center', 'fontSize': 12}
+            ),
+            dcc.Store(id='drought-event-tracks'),
+            dcc.Graph(id='drought-event-track', style={'display': 'none'})
+        ]),
+        style=CUSTOM_STYLES["card"]
+    ),
+    dbc.Card(
+        dbc.CardBody([
+            dbc.Progress(id='drought-area-progress', value=0, max=1, striped=True, animated=True,
+                         style={'display': 'none'}, className="mb-2"),
+            dcc.Graph(id='drought-area-plot')
         ]),
         style=CUSTOM_STYLES["card"]
     )
@@ -1334,38 +1789,46 @@ app.layout = dbc.Container(
 
 # Callback to toggle precipitation dropdown
 
-@app.callback(
+app.clientside_callback(
+    """
+    function(n, is_open) {
+        if (n) {
+            if (is_open) {
+                return [false, "fas fa-chevron-down ms-auto"];
+            }
+            return [true, "fas fa-chevron-up ms-auto"];
+        }
+        return [is_open, "fas fa-chevron-down ms-auto"];
+    }
+    """,
     Output("precipitation-collapse", "is_open"),
     Output("precipitation-arrow", "className"),
     [Input("precipitation-collapse-link", "n_clicks")],
     [State("precipitation-collapse", "is_open")]
 )
-def toggle_precipitation_collapse(n, is_open):
-    if n:
-        if is_open:
-            return False, "fas fa-chevron-down ms-auto"
-        else:
-            return True, "fas fa-chevron-up ms-auto"
-    return is_open, "fas fa-chevron-down ms-auto"
 
 
 
 
 # Callback to toggle drought dropdown
 
-@app.callback(
+app.clientside_callback(
+    """
+    function(n, is_open) {
+        if (n) {
+            if (is_open) {
+                return [false, "fas fa-chevron-down ms-auto"];
+            }
+            return [true, "fas fa-chevron-up ms-auto"];
+        }
+        return [is_open, "fas fa-chevron-down ms-auto"];
+    }
+    """,
     Output("drought-collapse", "is_open"),
     Output("drought-arrow", "className"),
     [Input("drought-collapse-link", "n_clicks")],
     [State("drought-collapse", "is_open")]
 )
-def toggle_drought_collapse(n, is_open):
-    if n:
-        if is_open:
-            return False, "fas fa-chevron-down ms-auto"
-        else:
-            return True, "fas fa-chevron-up ms-auto"
-    return is_open, "fas fa-chevron-down ms-auto"
 
 
 # Update the active nav link callback
@@ -1477,27 +1940,21 @@ def check_incomplete_season(selected_season, year_range):
 
 
 ############
-@app.callback(
+# If selected year == max_year, restrict months (runs in the browser with the data bounds baked in)
+app.clientside_callback(
+    """
+    function(selected_end_year) {
+        const monthNames = %s;
+        const lastMonth = selected_end_year === %d ? %d : 12;
+        const options = monthNames.slice(0, lastMonth).map((label, i) => ({'label': label, 'value': i + 1}));
+        // Reset value to the last valid month (December for past years)
+        return [options, lastMonth];
+    }
+    """ % (json.dumps(list(calendar.month_name)[1:]), max_date.year, max_date.month),
     Output('monthly-end-month', 'options'),
     Output('monthly-end-month', 'value'),  # Reset value if invalid
     Input('monthly-end-year', 'value'),
 )
-def update_end_month_options(selected_end_year):
-    # If selected year == max_year, restrict months
-    if selected_end_year == max_date.year:
-        options = [
-            {'label': calendar.month_name[i], 'value': i}
-            for i in range(1, max_date.month + 1)
-        ]
-        # Ensure current value is valid (e.g., if previously December was selected)
-        current_month = max_date.month
-        return options, current_month
-    else:
-        options = [
-            {'label': calendar.month_name[i], 'value': i}
-            for i in range(1, 13)
-        ]
-        return options, 12  # Default to December for past years
     
     
 # Seasonal Analysis Callbacks
@@ -1516,8 +1973,6 @@ def update_seasonal_analysis(selected_season, selected_years,plot_type):
     end_date = f"{selected_years[1]}-12-31"
     start_date = datetime.strptime(start_date, "%Y-%m-%d")
     end_date = datetime.strptime(end_date, "%Y-%m-%d")
-    filtered_dataset = data['seasonal_monthly_dataset'].sel(time=slice(start_date, end_date))
-    
     # Create description
     description = dbc.Alert(
         [
@@ -1536,11 +1991,9 @@ def update_seasonal_analysis(selected_season, selected_years,plot_type):
     )
 #pasta
     # Spatial plot
-    months = seasons[selected_season]
-    spatial_data = filtered_dataset.sel(time=filtered_dataset['time.month'].isin(months))
-    yearly_spatial = spatial_data.resample(time='YE').sum(skipna=True)
+    seasonal_totals = select_season(get_seasonal_totals(), selected_season, start_date.year, end_date.year)
+    yearly_spatial = seasonal_totals[['tp']]
     yearly_spatial_ = yearly_spatial.mean(dim=['time'])
-    yearly_spatial_ = yearly_spatial_.rio.clip(data['shp'].geometry.apply(mapping), data['shp'].crs, drop=False)
     
     da = yearly_spatial_['tp']
     lat = da['lat'].values
@@ -1558,15 +2011,19 @@ def update_seasonal_analysis(selected_season, selected_years,plot_type):
             title2="Precipitation (mm)"
         )
     else:
-        trend_data= calculate_spatial_trend(yearly_spatial)
-        spatial_fig= spatial_trend_plot(trend_data,"year")
+        # Quick preview on the coarsened cube; update_seasonal_trend_map replaces it at full resolution
+        preview_totals = select_season(get_preview_seasonal_totals(), selected_season, start_date.year, end_date.year)
+        trend_data = calculate_spatial_trend(preview_totals[['tp']])
+        spatial_fig = spatial_trend_plot(trend_data, "year", preview=True)
+
+    if callback_context.triggered_id == 'trend-plot-selector':
+        # Only the plot type changed: swap the map's heatmap and title, keep everything else on screen
+        return dash.no_update, dash.no_update, patch_spatial_figure(spatial_fig)
     
     
     # Temporal plot
-    yearly_spatial_latlonmean = yearly_spatial.rio.clip(data['shp'].geometry.apply(mapping), data['shp'].crs, drop=False)   
-    df_yearly_spatial = yearly_spatial_latlonmean.mean(dim=['lat','lon']).to_dataframe().reset_index()
-    df_yearly_spatial['year'] = df_yearly_spatial['time'].dt.year
-    season_dataframe = df_yearly_spatial.groupby('year')['tp'].sum()
+    season_dataframe = seasonal_totals['tp_area_mean'].to_series()
+    season_dataframe.index = season_dataframe.index.year
     values = season_dataframe.values
     
     temporal_fig = None
@@ -1599,43 +2056,53 @@ def update_seasonal_analysis(selected_season, selected_years,plot_type):
     
     return description, temporal_fig, spatial_fig
 
-# Temporal Analysis Callbacks
 @app.callback(
+    Output('seasonal-spatial-plot', 'figure', allow_duplicate=True),
+    [Input('season-selector', 'value'),
+     Input('year-range-slider', 'value'),
+     Input('trend-plot-selector', 'value')],
+    background=True,
+    progress=[Output('seasonal-trend-progress', 'value'),
+              Output('seasonal-trend-progress', 'max')],
+    running=[(Output('seasonal-trend-progress', 'style'), {'display': 'flex'}, {'display': 'none'})],
+    prevent_initial_call=True
+)
+def update_seasonal_trend_map(set_progress, selected_season, selected_years, plot_type):
+    # A newer input change terminates this job before starting the next one
+    if plot_type != 'trend':
+        raise PreventUpdate
+
+    seasonal_totals = select_season(get_seasonal_totals(), selected_season, selected_years[0], selected_years[1])
+    trend_data = calculate_spatial_trend(seasonal_totals[['tp']], progress=job_progress(set_progress))
+
+    # The preview map is already on screen, so only its heatmap and title need replacing
+    return patch_spatial_figure(spatial_trend_plot(trend_data, "year"))
+
+# Temporal Analysis Callbacks
+app.clientside_callback(
+    """
+    function(selected_freq) {
+        return ['Daily', 'Monthly', 'Yearly'].map(
+            freq => ({'display': freq === selected_freq ? 'block' : 'none'})
+        );
+    }
+    """,
     [Output('daily-controls', 'style'),
      Output('monthly-controls', 'style'),
      Output('yearly-controls', 'style')],
     [Input('freq-selector', 'value')]
 )
-def update_control_visibility(selected_freq):
-    daily_style = {'display': 'block'} if selected_freq == 'Daily' else {'display': 'none'}
-    monthly_style = {'display': 'block'} if selected_freq == 'Monthly' else {'display': 'none'}
-    yearly_style = {'display': 'block'} if selected_freq == 'Yearly' else {'display': 'none'}
-    return daily_style, monthly_style, yearly_style
 
 ### Update month options based on selected year for monthly analysis
 
-@app.callback(
-    [Output('temporal-spatial-plot', 'figure'),
-     Output('temporal-trend-plot', 'figure')],
-    [Input('freq-selector', 'value'),
-     Input('daily-start-date', 'date'),
-     Input('daily-end-date', 'date'),
-     Input('monthly-start-year', 'value'),
-     Input('monthly-start-month', 'value'),
-     Input('monthly-end-year', 'value'),
-     Input('monthly-end-month', 'value'),
-     Input('yearly-start-year', 'value'),
-     Input('yearly-end-year', 'value'),
-     Input('temporal-trend-plot-selector', 'value')]
-)
-def update_temporal_analysis(selected_freq, daily_start, daily_end, 
-                           monthly_start_year, monthly_start_month, 
-                           monthly_end_year, monthly_end_month,
-                           yearly_start_year, yearly_end_year, plot_type):
+def get_temporal_date_range(selected_freq, daily_start, daily_end,
+                            monthly_start_year, monthly_start_month,
+                            monthly_end_year, monthly_end_month,
+                            yearly_start_year, yearly_end_year):
     # Determine the dataset and date range based on frequency
     if selected_freq == "Daily":
         if not daily_start or not daily_end:
-            return go.Figure(), go.Figure()
+            return None
             
         dataset = data['daily_dataset']
         start_date = daily_start
@@ -1643,7 +2110,7 @@ def update_temporal_analysis(selected_freq, daily_start, daily_end,
     elif selected_freq == "Monthly":
         if (not monthly_start_year or not monthly_start_month or 
             not monthly_end_year or not monthly_end_month):
-            return go.Figure(), go.Figure()
+            return None
             
         dataset = data['monthly_dataset']
         start_date = date(int(monthly_start_year), int(monthly_start_month), 1)
@@ -1656,29 +2123,58 @@ def update_temporal_analysis(selected_freq, daily_start, daily_end,
         end_date = pd.Timestamp(end_str).to_period('M').end_time.strftime('%Y-%m-%d')
     else:  # Yearly
         if not yearly_start_year or not yearly_end_year:
-            return go.Figure(), go.Figure()
+            return None
             
         dataset = data['yearly_dataset']
         start_date = date(int(yearly_start_year), 1, 1)
         end_date = date(int(yearly_end_year), 12, 31)
+
+    return dataset, start_date, end_date
+
+@app.callback(
+    [Output('temporal-spatial-plot', 'figure'),
+     Output('temporal-trend-plot', 'figure')],
+    [Input('freq-selector', 'value'),
+     Input('daily-start-date', 'date'),
+     Input('daily-end-date', 'date'),
+     Input('monthly-start-year', 'value'),
+     Input('monthly-start-month', 'value'),
+     Input('monthly-end-year', 'value'),
+     Input('monthly-end-month', 'value'),
+     Input('yearly-start-year', 'value'),
+     Input('yearly-end-year', 'value'),
+     Input('temporal-trend-plot-selector', 'value'),
+     Input('temporal-zone-selector', 'value'),
+     Input('temporal-trend-method', 'value')]
+)
+def update_temporal_analysis(selected_freq, daily_start, daily_end, 
+                           monthly_start_year, monthly_start_month, 
+                           monthly_end_year, monthly_end_month,
+                           yearly_start_year, yearly_end_year, plot_type, zone, method):
+    date_range = get_temporal_date_range(selected_freq, daily_start, daily_end,
+                                         monthly_start_year, monthly_start_month,
+                                         monthly_end_year, monthly_end_month,
+                                         yearly_start_year, yearly_end_year)
+    if date_range is None:
+        return go.Figure(), go.Figure()
+    dataset, start_date, end_date = date_range
     
-    # Rest of your processing remains the same...
-    selected_data = dataset.sel(time=slice(str(start_date), str(end_date)))
     start_year = pd.to_datetime(start_date).year
     end_year = pd.to_datetime(end_date).year
     
     #pasta
     # # Spatial plot
     
-    avg_precip = selected_data.mean(dim='time')
+    avg_precip = range_mean(get_prefix_sums(selected_freq, get_map_level(selected_freq)), start_date, end_date)
     avg_precip = avg_precip.rio.clip(data['shp'].geometry.apply(mapping), data['shp'].crs, drop=False)
     da3 = avg_precip['tp']
     lat3 = da3['lat'].values
     lon3 = da3['lon'].values
     z3 = da3.values
+    has_map_data = not (np.isnan(z3).all() or np.nansum(z3) == 0)
     if plot_type=='distribution':
         spatial_fig = go.Figure()
-        if not (np.isnan(z3).all() or np.nansum(z3) == 0):
+        if has_map_data:
             spatial_fig = plot_precipitation_distribution(
                 z=z3,
                 x=lon3,
@@ -1694,25 +2190,71 @@ def update_temporal_analysis(selected_freq, daily_start, daily_end,
                 xaxis_title="Longitude",
                 yaxis_title="Latitude"
             )
+    elif plot_type in TREND_MAP_TYPES and selected_freq not in TREND_FREQUENCIES:
+        spatial_fig = go.Figure()
+        spatial_fig.update_layout(
+            title="Trend maps are available for Monthly and Yearly data",
+            xaxis_title="Longitude",
+            yaxis_title="Latitude"
+        )
+    elif plot_type in TREND_INTERVAL_TYPES and selected_freq not in TREND_INTERVAL_FREQUENCIES:
+        spatial_fig = go.Figure()
+        spatial_fig.update_layout(
+            title="Trend CI Width and Robust Trend maps are available for Yearly data",
+            xaxis_title="Longitude",
+            yaxis_title="Latitude"
+        )
+    elif plot_type in TREND_INTERVAL_TYPES:
+        # No quick coarse version of the bootstrap exists, so the map stays blank until update_temporal_trend_map
+        # draws it; a significant-trend preview would show a different quantity
+        spatial_fig = go.Figure()
+        spatial_fig.update_layout(
+            title=f"Computing the {'Trend CI Width' if plot_type == 'trend_ci' else 'Robust Trend'} map...",
+            xaxis_title="Longitude",
+            yaxis_title="Latitude"
+        )
+    elif plot_type in TREND_MAP_TYPES:
+        # Quick preview on the coarsened cube; update_temporal_trend_map replaces it at full resolution
+        preview_data = get_preview_dataset(selected_freq).sel(time=slice(str(start_date), str(end_date)))
+        test = trend_method(method, selected_freq)
+        spatial_trend = calculate_spatial_trend(preview_data, method=test)
+        spatial_fig = spatial_trend_plot(spatial_trend, TREND_TIME_UNITS.get(selected_freq, 'year'), preview=True,
+                                         test_name=TREND_TEST_NAMES[test])
+    elif plot_type == 'changepoint':
+        # The batched Pettitt test is a few passes over the cube, so it runs at full resolution directly
+        changepoint = calculate_spatial_changepoint(dataset.sel(time=slice(str(start_date), str(end_date))))
+        spatial_fig = changepoint_plot(changepoint)
     else:
-        spatial_trend = calculate_spatial_trend(selected_data)
-        time_unit = {
-            'Daily': 'day',
-            'Monthly': 'month',
-            'Yearly': 'year'
-        }.get(selected_freq, 'year')  # Default to month if not matched
+        # The tiled map has its own graph, drawn by update_temporal_tile_map
+        spatial_fig = dash.no_update
+
+    if callback_context.triggered_id == 'temporal-trend-plot-selector' and plot_type == 'tiles':
+        raise PreventUpdate
+
+    if callback_context.triggered_id == 'temporal-trend-plot-selector' and has_map_data and spatial_fig.data:
+        # Only the plot type changed: swap the map's heatmap and title, keep the trend plot as is
+        return patch_spatial_figure(spatial_fig), dash.no_update
 
-        spatial_fig = spatial_trend_plot(spatial_trend, time_unit)
+    if callback_context.triggered_id == 'temporal-zone-selector':
+        # Only the area changed: the map stays as it is
+        spatial_fig = dash.no_update
 
+    if callback_context.triggered_id == 'temporal-trend-method' and plot_type != 'trend':
+        # The method only changes the trend map; the other maps stay as they are
+        spatial_fig = dash.no_update
 
     # Temporal plot
-    dataframe_avg_precip = selected_data['tp'].mean(dim=['lat', 'lon']).to_dataframe(name='tp').reset_index()
-    values = dataframe_avg_precip['tp'].dropna().values
+    area_label = f" - {zone.replace('/', ': ')}" if zone else ""
+    dataframe_avg_precip = get_temporal_series(selected_freq, zone).loc[str(start_date):str(end_date)].reset_index()
+    observed = dataframe_avg_precip.dropna(subset=['tp'])
+    values = observed['tp'].values
     
     temporal_fig = go.Figure()
     if len(values) >= 2:
         try:
-            mk_result = mk.original_test(values)
+            method = trend_method(method, selected_freq)
+            seasons = observed['time'].dt.month.values if method == 'seasonal' else None
+            mk_result = trend_test(values, method, seasons)
             y_max = values.max()
             y_min = values.min()
             y_pad = y_max * 0.1
@@ -1720,15 +2262,16 @@ def update_temporal_analysis(selected_freq, daily_start, daily_end,
             temporal_fig = plot_precipitation_trend(
                 x=dataframe_avg_precip['time'],
                 y=dataframe_avg_precip['tp'],
-                legend='Average Precipitation',
-                hovertemplate='<b>Year</b>: %{x}<br><b>Average Precipitation</b>: %{y:.1f} mm<extra></extra>',
-                title=f"<b>Average {selected_freq} Precipitation ({start_year} to {end_year})</b><br>Temporal Trend",
+                legend=TEMPORAL_TREND_LEGEND,
+                hovertemplate=TEMPORAL_TREND_HOVERTEMPLATE,
+                title=f"<b>Average {selected_freq} Precipitation ({start_year} to {end_year})</b><br>Temporal Trend{area_label}",
                 yaxis='Average Precipitation (mm)',
                 mk_result=mk_result,
                 y_max=y_max,
                 y_min=y_min,
                 y_pad=y_pad,
-                unit='mm'
+                unit='mm',
+                test_name=TREND_TEST_NAMES[method]
             )
         except ValueError as e:
             temporal_fig.update_layout(
@@ -1745,16 +2288,363 @@ def update_temporal_analysis(selected_freq, daily_start, daily_end,
     
     return spatial_fig, temporal_fig
 
-# Indices Analysis Callbacks
 @app.callback(
+    Output('temporal-spatial-plot', 'figure', allow_duplicate=True),
+    [Input('freq-selector', 'value'),
+     Input('daily-start-date', 'date'),
+     Input('daily-end-date', 'date'),
+     Input('monthly-start-year', 'value'),
+     Input('monthly-start-month', 'value'),
+     Input('monthly-end-year', 'value'),
+     Input('monthly-end-month', 'value'),
+     Input('yearly-start-year', 'value'),
+     Input('yearly-end-year', 'value'),
+     Input('temporal-trend-plot-selector', 'value'),
+     Input('temporal-trend-method', 'value')],
+    background=True,
+    progress=[Output('temporal-trend-progress', 'value'),
+              Output('temporal-trend-progress', 'max')],
+    running=[(Output('temporal-trend-progress', 'style'), {'display': 'flex'}, {'display': 'none'})],
+    prevent_initial_call=True
+)
+def update_temporal_trend_map(set_progress, selected_freq, daily_start, daily_end,
+                              monthly_start_year, monthly_start_month,
+                              monthly_end_year, monthly_end_month,
+                              yearly_start_year, yearly_end_year, plot_type, method):
+    if plot_type not in TREND_MAP_TYPES or selected_freq not in TREND_FREQUENCIES:
+        raise PreventUpdate
+    if plot_type in TREND_INTERVAL_TYPES and selected_freq not in TREND_INTERVAL_FREQUENCIES:
+        raise PreventUpdate
+
+    date_range = get_temporal_date_range(selected_freq, daily_start, daily_end,
+                                         monthly_start_year, monthly_start_month,
+                                         monthly_end_year, monthly_end_month,
+                                         yearly_start_year, yearly_end_year)
+    if date_range is None:
+        raise PreventUpdate
+    dataset, start_date, end_date = date_range
+
+    selected_data = dataset.sel(time=slice(str(start_date), str(end_date)))
+    if plot_type != 'trend':
+        # Bootstrap intervals are stored per frequency and range, so only the first request pays for them
+        intervals = load_trend_intervals(
+            selected_data,
+            f"{selected_freq.lower()}_{pd.Timestamp(str(start_date)):%Y%m%d}_{pd.Timestamp(str(end_date)):%Y%m%d}",
+            CHIRPS_PREPROCESSING.MERGED_FILE,
+            progress=job_progress(set_progress)
+        )
+        return trend_interval_plot(intervals, TREND_TIME_UNITS.get(selected_freq, 'year'), plot_type)
+
+    test = trend_method(method, selected_freq)
+    spatial_trend = calculate_spatial_trend(selected_data, progress=job_progress(set_progress), method=test)
+
+    # Full figure: the map on screen may be the empty placeholder, which has no heatmap to patch
+    return spatial_trend_plot(spatial_trend, TREND_TIME_UNITS.get(selected_freq, 'year'),
+                              test_name=TREND_TEST_NAMES[test])
+
+app.clientside_callback(
+    """
+    function(plot_type) {
+        const tiles = plot_type === 'tiles';
+        return [{'display': tiles ? 'none' : 'block'}, {'display': tiles ? 'block' : 'none'}];
+    }
+    """,
+    [Output('temporal-spatial-plot', 'style'),
+     Output('temporal-tile-map', 'style')],
+    [Input('temporal-trend-plot-selector', 'value')]
+)
+
+@app.callback(
+    Output('temporal-tile-map', 'figure'),
+    [Input('freq-selector', 'value'),
+     Input('daily-start-date', 'date'),
+     Input('daily-end-date', 'date'),
+     Input('monthly-start-year', 'value'),
+     Input('monthly-start-month', 'value'),
+     Input('monthly-end-year', 'value'),
+     Input('monthly-end-month', 'value'),
+     Input('yearly-start-year', 'value'),
+     Input('yearly-end-year', 'value'),
+     Input('temporal-trend-plot-selector', 'value')],
+    prevent_initial_call=True
+)
+def update_temporal_tile_map(selected_freq, daily_start, daily_end,
+                             monthly_start_year, monthly_start_month,
+                             monthly_end_year, monthly_end_month,
+                             yearly_start_year, yearly_end_year, plot_type):
+    # Only the tile URL changes with the inputs; the browser fetches the visible tiles itself
+    if plot_type != 'tiles':
+        raise PreventUpdate
+
+    date_range = get_temporal_date_range(selected_freq, daily_start, daily_end,
+                                         monthly_start_year, monthly_start_month,
+                                         monthly_end_year, monthly_end_month,
+                                         yearly_start_year, yearly_end_year)
+    if date_range is None:
+        raise PreventUpdate
+    _, start_date, end_date = date_range
+
+    layer = f"precipitation-{selected_freq.lower()}"
+    period = f"{pd.Timestamp(str(start_date)):%Y-%m-%d}_{pd.Timestamp(str(end_date)):%Y-%m-%d}"
+    tile_layer = get_tile_layer(layer, period)
+    min_lon, min_lat, max_lon, max_lat = data['shp'].total_bounds
+
+    return plot_tile_map(
+        tile_url=f"/tiles/{layer}/{period}/{{z}}/{{x}}/{{y}}.png",
+        colorscale=tile_layer['colorscale'],
+        cmin=tile_layer['range'][0],
+        cmax=tile_layer['range'][1],
+        colorbar='ppt(mm)',
+        title=f"<b>Average {selected_freq} Precipitation ({pd.Timestamp(str(start_date)).year} to {pd.Timestamp(str(end_date)).year})</b><br>Interactive Map",
+        center={'lat': (min_lat + max_lat) / 2, 'lon': (min_lon + max_lon) / 2},
+        zoom=6
+    )
+
+# Re-request full resolution for the zoomed window of the temporal trend plot
+@app.callback(
+    Output('temporal-trend-plot', 'figure', allow_duplicate=True),
+    [Input('temporal-trend-plot', 'relayoutData')],
+    [State('freq-selector', 'value'),
+     State('daily-start-date', 'date'),
+     State('daily-end-date', 'date'),
+     State('monthly-start-year', 'value'),
+     State('monthly-start-month', 'value'),
+     State('monthly-end-year', 'value'),
+     State('monthly-end-month', 'value'),
+     State('yearly-start-year', 'value'),
+     State('yearly-end-year', 'value'),
+     State('temporal-zone-selector', 'value')],
+    prevent_initial_call=True
+)
+def refine_temporal_trend_window(relayout_data, selected_freq, daily_start, daily_end,
+                                 monthly_start_year, monthly_start_month,
+                                 monthly_end_year, monthly_end_month,
+                                 yearly_start_year, yearly_end_year, zone):
+    if not relayout_data:
+        raise PreventUpdate
+
+    date_range = get_temporal_date_range(selected_freq, daily_start, daily_end,
+                                         monthly_start_year, monthly_start_month,
+                                         monthly_end_year, monthly_end_month,
+                                         yearly_start_year, yearly_end_year)
+    if date_range is None:
+        raise PreventUpdate
+    _, start_date, end_date = date_range
+
+    series = get_temporal_series(selected_freq, zone).loc[str(start_date):str(end_date)]
+    if len(series) <= MAX_POINTS:
+        raise PreventUpdate  # Already plotted at full resolution
+
+    if 'xaxis.range[0]' in relayout_data:
+        window = (relayout_data['xaxis.range[0]'], relayout_data['xaxis.range[1]'])
+        series = series.loc[pd.Timestamp(window[0]):pd.Timestamp(window[1])]
+    elif not relayout_data.get('xaxis.autorange'):
+        raise PreventUpdate
+
+    if series.empty:
+        raise PreventUpdate
+
+    patched_fig = Patch()
+    patched_fig['data'][0] = trend_trace(series.index, series.values,
+                                         TEMPORAL_TREND_LEGEND, TEMPORAL_TREND_HOVERTEMPLATE)
+    return patched_fig
+
+# Full record of the clicked map pixel, read as one contiguous row of the space-major cube
+@app.callback(
+    [Output('temporal-pixel-plot', 'figure'),
+     Output('temporal-pixel-plot', 'style')],
+    [Input('temporal-spatial-plot', 'clickData')],
+    [State('freq-selector', 'value')],
+    prevent_initial_call=True
+)
+def update_temporal_pixel_series(click_data, selected_freq):
+    if not click_data or selected_freq not in FREQUENCY_DATASETS:
+        raise PreventUpdate
+
+    point = click_data['points'][0]
+    result = pixel_series(get_pixel_major(selected_freq), point['y'], point['x'])
+    if result is None:
+        raise PreventUpdate
+    series, (lat, lon) = result
+
+    fig = plot_pixel_series(
+        x=series.index,
+        y=series.values,
+        legend=f'{selected_freq} Precipitation',
+        hovertemplate='<b>Date</b>: %{x}<br><b>Precipitation</b>: %{y:.1f} mm<extra></extra>',
+        title=f"<b>{selected_freq} Precipitation at {lat:.3f}°N, {lon:.3f}°E</b><br>Full Record",
+        yaxis='Precipitation (mm)'
+    )
+    return fig, {'display': 'block'}
+
+# Indices Analysis Callbacks
+app.clientside_callback(
+    """
+    function(selected_type) {
+        return ['threshold', 'quantile', 'etccdi', 'spells', 'return'].map(
+            type => ({'display': type === selected_type ? 'block' : 'none'})
+        );
+    }
+    """,
     [Output('threshold-controls', 'style'),
-     Output('quantile-controls', 'style')],
+     Output('quantile-controls', 'style'),
+     Output('etccdi-controls', 'style'),
+     Output('spell-controls', 'style'),
+     Output('return-controls', 'style')],
     [Input('indices-type-selector', 'value')]
 )
-def update_indices_controls_visibility(selected_type):
-    threshold_style = {'display': 'block'} if selected_type == 'threshold' else {'display': 'none'}
-    quantile_style = {'display': 'block'} if selected_type == 'quantile' else {'display': 'none'}
-    return threshold_style, quantile_style
+
+def threshold_exceedance_days(threshold, year_range):
+    """Yearly counts of days above threshold for the years in year_range, clipped to Nepal"""
+    filtered_dataset = data['daily_dataset'].sel(time=slice(f"{year_range[0]}-01-01", f"{year_range[1]}-12-31"))
+    daily_dataset_mm = exceedance_days(get_exceedance_index(), threshold, filtered_dataset, get_wet_day_store())
+    return daily_dataset_mm.rio.clip(data['shp'].geometry.apply(mapping), data['shp'].crs, drop=False)
+
+def select_years(index, year_range):
+    years = index['time'].dt.year
+    return index.sel(time=(years >= year_range[0]) & (years <= year_range[1])).rename('tp')
+
+def yearly_index(selected_type, index_value, year_range):
+    """Yearly cube, short name, description and units of an ETCCDI index or a 'kind/statistic' spell statistic"""
+    if selected_type == 'spells':
+        kind, _, statistic = index_value.partition('/')
+        description, units = SPELL_STATISTICS[statistic]
+        yearly = select_years(get_spell_statistics(kind)[statistic], year_range)
+        return yearly, f"{kind.capitalize()} spells", f"{description} ({kind} days)", units
+
+    description, units = ETCCDI_INDICES[index_value]
+    return select_years(get_etccdi_indices()[index_value], year_range), index_value, description, units
+
+def return_level_analysis(return_period, show_ci):
+    """Return-level map of one return period and the area-mean return-level curve, from the cached GEV fit"""
+    levels = get_return_levels(0.9 if show_ci else None, data['version'])
+    level_map = clip_to_nepal(levels['return_level'].sel(return_period=return_period))
+    z = level_map.values
+
+    spatial_fig = go.Figure()
+    if not np.isnan(z).all():
+        hovertemplate = f'<b>Longitude</b>: %{{x}}<br><b>Latitude</b>: %{{y}}<br><b>{return_period}-year Level</b>: %{{z:.1f}} mm'
+        spatial_fig = plot_precipitation_distribution(
+            z=z,
+            x=level_map['lon'].values,
+            y=level_map['lat'].values,
+            colorbar='mm/day',
+            hovertemplate=hovertemplate + '<extra></extra>',
+            title=f"<b>{return_period}-year Return Level of Daily Rainfall</b><br>GEV fitted by L-moments to annual maxima",
+            title2="Return level (mm/day)"
+        )
+        if show_ci:
+            bounds = np.stack([clip_to_nepal(levels[bound].sel(return_period=return_period)).values
+                               for bound in ('lower', 'upper')], axis=-1)
+            spatial_fig.update_traces(
+                customdata=bounds,
+                hovertemplate=hovertemplate + '<br><b>90% CI</b>: %{customdata[0]:.1f} to %{customdata[1]:.1f} mm<extra></extra>',
+                selector=dict(type='heatmap')
+            )
+    else:
+        spatial_fig.update_layout(
+            title="No data available for return levels",
+            xaxis_title="Longitude",
+            yaxis_title="Latitude"
+        )
+
+    # Area-weighted mean return level against return period; the time axis of area_mean carries the periods
+    def area_curve(variable):
+        return area_mean(get_area_weights(), levels[variable].rename(return_period='time')).values
+
+    temporal_fig = go.Figure()
+    if show_ci:
+        temporal_fig.add_trace(go.Scatter(
+            x=list(RETURN_PERIODS) + list(RETURN_PERIODS)[::-1],
+            y=list(area_curve('upper')) + list(area_curve('lower'))[::-1],
+            fill='toself',
+            fillcolor='rgba(65,105,225,0.2)',
+            line=dict(width=0),
+            hoverinfo='skip',
+            name='90% CI'
+        ))
+    temporal_fig.add_trace(go.Scatter(
+        x=list(RETURN_PERIODS),
+        y=area_curve('return_level'),
+        mode='lines+markers',
+        name='Return level',
+        line=dict(color='royalblue', width=3),
+        marker=dict(size=8, color='white', line=dict(width=2, color='darkblue')),
+        hovertemplate='<b>%{x}-year</b>: %{y:.1f} mm<extra></extra>'
+    ))
+    temporal_fig.update_layout(
+        title=dict(text="<b>Area-Mean Return Levels of Daily Rainfall</b>", x=0.5, xanchor='center',
+                   font=dict(size=18, family="Arial Black", color='MidnightBlue')),
+        xaxis=dict(title='Return period (years)', type='log', tickvals=list(RETURN_PERIODS)),
+        yaxis=dict(title='Return level (mm/day)'),
+        plot_bgcolor='rgba(240,248,255, 0.4)',
+        width=1250,
+        height=500
+    )
+
+    return spatial_fig, temporal_fig
+
+def yearly_index_analysis(selected_type, index_value, year_range, plot_type):
+    """Map and area-mean trend figures of a cached yearly index cube (ETCCDI index or spell statistic)"""
+    yearly, index_name, description, units = yearly_index(selected_type, index_value, year_range)
+    subtitle = f"{index_name}: {description}"
+
+    mean_map = yearly.mean(dim='time', skipna=True)
+    z = mean_map.values
+    has_map_data = not np.isnan(z).all()
+    if plot_type == 'distribution':
+        spatial_fig = go.Figure()
+        if has_map_data:
+            spatial_fig = plot_precipitation_distribution(
+                z=z,
+                x=mean_map['lon'].values,
+                y=mean_map['lat'].values,
+                colorbar=units,
+                hovertemplate=f'<b>Longitude</b>: %{{x}}<br><b>Latitude</b>: %{{y}}<br><b>{index_name}</b>: %{{z:.2f}} {units}<extra></extra>',
+                title=f"<b>Spatial Distribution of {index_name} ({year_range[0]}–{year_range[1]})</b><br>{subtitle}",
+                title2=f"{index_name} ({units})"
+            )
+        else:
+            spatial_fig.update_layout(
+                title="No data available for selected index",
+                xaxis_title="Longitude",
+                yaxis_title="Latitude"
+            )
+    else:
+        # Quick preview on the coarsened index; update_indices_trend_map replaces it at full resolution
+        spatial_trend = calculate_spatial_trend(coarsen_preview(yearly).to_dataset(name='tp'))
+        spatial_fig = spatial_trend_plot(spatial_trend, "year", preview=True)
+
+    if callback_context.triggered_id == 'extremes-plot-selector' and has_map_data:
+        # Only the plot type changed: swap the map's heatmap and title, keep the trend plot as is
+        return patch_spatial_figure(spatial_fig), dash.no_update
+
+    series = area_mean(get_area_weights(), yearly).to_series().dropna()
+    values = series.values
+
+    temporal_fig = go.Figure()
+    if len(values) > 2:
+        temporal_fig = plot_precipitation_trend(
+            x=series.index.year,
+            y=values,
+            legend=index_name,
+            hovertemplate=f'<b>Year</b>: %{{x}}<br><b>{index_name}</b>: %{{y:.1f}} {units}<extra></extra>',
+            title=f"<b>Temporal Trend of {index_name} ({year_range[0]}–{year_range[1]})</b><br>{subtitle}",
+            yaxis=f"{index_name} ({units})",
+            y_max=values.max(),
+            y_min=values.min(),
+            y_pad=values.max() * 0.1,
+            mk_result=mk.original_test(values),
+            unit=f"{units}/year"
+        )
+    else:
+        temporal_fig.update_layout(
+            title="Not enough data points for trend analysis",
+            xaxis_title="Year",
+            yaxis_title=f"{index_name} ({units})"
+        )
+
+    return spatial_fig, temporal_fig
 
 @app.callback(
     [Output('indices-spatial-plot', 'figure'),
@@ -1763,32 +2653,46 @@ def update_indices_controls_visibility(selected_type):
      Input('threshold-selector', 'value'),
      Input('indices-year-range-slider', 'value'),
      Input('percentile-selector', 'value'),
-     Input('extremes-plot-selector', 'value')]
+     Input('extremes-plot-selector', 'value'),
+     Input('etccdi-index-selector', 'value'),
+     Input('etccdi-year-range-slider', 'value'),
+     Input('spell-index-selector', 'value'),
+     Input('spell-year-range-slider', 'value'),
+     Input('return-period-selector', 'value'),
+     Input('return-ci-toggle', 'value')]
 )
-def update_indices_analysis(selected_type, threshold, year_range, percentile, plot_type):
+def update_indices_analysis(selected_type, threshold, year_range, percentile, plot_type,
+                            etccdi_index, etccdi_year_range, spell_index, spell_year_range,
+                            return_period, return_ci):
+    if selected_type == 'etccdi':
+        return yearly_index_analysis(selected_type, etccdi_index, etccdi_year_range, plot_type)
+    if selected_type == 'spells':
+        return yearly_index_analysis(selected_type, spell_index, spell_year_range, plot_type)
+    if selected_type == 'return':
+        if callback_context.triggered_id == 'extremes-plot-selector':
+            raise PreventUpdate  # Return levels have no trend map
+        return return_level_analysis(return_period, 'ci' in (return_ci or []))
+
     if selected_type == 'threshold':
         # Threshold-based analysis
         start_date = f"{year_range[0]}-01-01"
         end_date = f"{year_range[1]}-12-31"
         start_date = datetime.strptime(start_date, "%Y-%m-%d")
         end_date = datetime.strptime(end_date, "%Y-%m-%d")
-        filtered_dataset = data['daily_dataset'].sel(time=slice(start_date, end_date))
-        
 
         #pasta
         # Spatial plot
-        binary_mask = xr.where(filtered_dataset['tp'] >= threshold, 1, 0)
-        daily_dataset_mm = binary_mask.resample(time='YE').sum(dim=['time'])
-        daily_dataset_mm = daily_dataset_mm.rio.clip(data['shp'].geometry.apply(mapping), data['shp'].crs, drop=False)
+        daily_dataset_mm = threshold_exceedance_days(threshold, year_range)
         daily_dataset_mm_ = daily_dataset_mm.mean(dim=['time'], skipna=True)
         daily_dataset_mm_ = daily_dataset_mm_.rio.clip(data['shp'].geometry.apply(mapping), data['shp'].crs, drop=False)
         da4 = daily_dataset_mm_
         lat4 = da4['lat'].values
         lon4 = da4['lon'].values
         z4 = da4.values
+        has_map_data = not (np.isnan(z4).all() or np.nansum(z4) == 0)
         if plot_type =='distribution':
             spatial_fig = go.Figure()
-            if not (np.isnan(z4).all() or np.nansum(z4) == 0):
+            if has_map_data:
                 spatial_fig = plot_precipitation_distribution(
                     z=z4,
                     x=lon4,
@@ -1805,10 +2709,16 @@ def update_indices_analysis(selected_type, threshold, year_range, percentile, pl
                     yaxis_title="Latitude"
                 )
         else:
-            spatial_trend= calculate_spatial_trend(daily_dataset_mm)
-            spatial_fig= spatial_trend_plot(spatial_trend,"year")
+            # Quick preview on the coarsened counts; update_indices_trend_map replaces it at full resolution
+            spatial_trend = calculate_spatial_trend(coarsen_preview(daily_dataset_mm).to_dataset(name='tp'))
+            spatial_fig = spatial_trend_plot(spatial_trend, "year", preview=True)
+
+        if callback_context.triggered_id == 'extremes-plot-selector' and has_map_data:
+            # Only the plot type changed: swap the map's heatmap and title, keep the trend plot as is
+            return patch_spatial_figure(spatial_fig), dash.no_update
+
         # Temporal plot
-        df_daily_dataset_mm_latlonmean = daily_dataset_mm.mean(dim=['lat','lon'], skipna=True)
+        df_daily_dataset_mm_latlonmean = area_mean(get_area_weights(), daily_dataset_mm)
         yearly = df_daily_dataset_mm_latlonmean.to_dataframe(name='tp').reset_index()
         yearly['year'] = yearly['time'].dt.year
         yearly = yearly.groupby('year')['tp'].sum()
@@ -1844,12 +2754,18 @@ def update_indices_analysis(selected_type, threshold, year_range, percentile, pl
         return spatial_fig, temporal_fig
     
     else:  # quantile
+        if callback_context.triggered_id == 'extremes-plot-selector':
+            raise PreventUpdate  # The quantile maps do not depend on the plot type
+
         # Quantile-based analysis
-        reference_period = data['daily_dataset'].sel(time=slice("1981-01-01", "2021-12-31"))
-        ref_tp = reference_period['tp'].values.flatten()
-        ref_tp = ref_tp[~np.isnan(ref_tp)]
-        wet_days = ref_tp[ref_tp >= 1.0]
-        scalar_threshold = np.percentile(wet_days, percentile)
+        if get_wet_day_store() is not None:
+            scalar_threshold = wet_day_percentile(get_wet_day_store(), "1981-01-01", "2021-12-31", percentile)
+        else:
+            reference_period = data['daily_dataset'].sel(time=slice("1981-01-01", "2021-12-31"))
+            ref_tp = reference_period['tp'].values.flatten()
+            ref_tp = ref_tp[~np.isnan(ref_tp)]
+            wet_days = ref_tp[ref_tp >= 1.0]
+            scalar_threshold = np.percentile(wet_days, percentile)
         
         wet_days_mask = data['daily_dataset']['tp'] >= 1.0
         wet_days_tp = data['daily_dataset']['tp'].where(wet_days_mask, other=0)
@@ -1857,7 +2773,7 @@ def update_indices_analysis(selected_type, threshold, year_range, percentile, pl
         extreme_tp =data['daily_dataset']['tp'].where(extreme_days_mask, other=0)
         annual_total_extreme_prcp = extreme_tp.resample(time='YE').sum(dim='time')
         masked_prcp = annual_total_extreme_prcp.where(annual_total_extreme_prcp > 0)
-        annual_mean = masked_prcp.mean(dim=['lat', 'lon'], skipna=True)
+        annual_mean = area_mean(get_area_weights(), masked_prcp)
         df_annual = annual_mean.to_dataframe(name='mean_extreme_prcp').reset_index()
         df_annual['year'] = df_annual['time'].dt.year
         
@@ -1918,6 +2834,40 @@ def update_indices_analysis(selected_type, threshold, year_range, percentile, pl
         
         return spatial_fig, temporal_fig
 
+@app.callback(
+    Output('indices-spatial-plot', 'figure', allow_duplicate=True),
+    [Input('indices-type-selector', 'value'),
+     Input('threshold-selector', 'value'),
+     Input('indices-year-range-slider', 'value'),
+     Input('percentile-selector', 'value'),
+     Input('extremes-plot-selector', 'value'),
+     Input('etccdi-index-selector', 'value'),
+     Input('etccdi-year-range-slider', 'value'),
+     Input('spell-index-selector', 'value'),
+     Input('spell-year-range-slider', 'value')],
+    background=True,
+    progress=[Output('indices-trend-progress', 'value'),
+              Output('indices-trend-progress', 'max')],
+    running=[(Output('indices-trend-progress', 'style'), {'display': 'flex'}, {'display': 'none'})],
+    prevent_initial_call=True
+)
+def update_indices_trend_map(set_progress, selected_type, threshold, year_range, percentile, plot_type,
+                             etccdi_index, etccdi_year_range, spell_index, spell_year_range):
+    # The quantile totals have no trend map
+    if selected_type not in ('threshold', 'etccdi', 'spells') or plot_type != 'trend':
+        raise PreventUpdate
+
+    if selected_type == 'etccdi':
+        yearly = yearly_index(selected_type, etccdi_index, etccdi_year_range)[0]
+    elif selected_type == 'spells':
+        yearly = yearly_index(selected_type, spell_index, spell_year_range)[0]
+    else:
+        yearly = threshold_exceedance_days(threshold, year_range)
+    spatial_trend = calculate_spatial_trend(yearly.to_dataset(name='tp'), progress=job_progress(set_progress))
+
+    # Full figure: the map on screen may be the empty placeholder, which has no heatmap to patch
+    return spatial_trend_plot(spatial_trend, "year")
+
 
 
 # Drought Analysis Callbacks
@@ -1926,9 +2876,13 @@ def update_indices_analysis(selected_type, threshold, year_range, percentile, pl
     [Input('spi-selector', 'value'),
      Input('year-selected', 'value'),
      Input('month-selected', 'value')],
+    background=True,
+    progress=[Output('spi-progress', 'value'),
+              Output('spi-progress', 'max')],
+    running=[(Output('spi-progress', 'style'), {'display': 'flex'}, {'display': 'none'})],
     prevent_initial_call=True
 )
-def update_drought_analysis(spi_type, year, month):
+def update_drought_analysis(set_progress, spi_type, year, month):
     try:
         # Basic input validation
         if None in [spi_type, year, month]:
@@ -1938,8 +2892,8 @@ def update_drought_analysis(spi_type, year, month):
         year = int(year)
         month = int(month)
         
-        # Calculate SPI
-        spi_da = calculate_spi_with_ufunc(data['monthly_dataset'], spi_type)
+        # SPI of the chosen timescale, computed on the first request for it
+        spi_da = get_spi_cube(spi_type, progress=job_progress(set_progress))
         
         # Get target date
         target_date = pd.Timestamp(year=year, month=month, day=1).to_period('M').end_time
@@ -1964,38 +2918,11 @@ def update_drought_analysis(spi_type, year, month):
             print(f"Clipping failed: {str(e)}")
             spi_clipped = spi_selected  # Fallback to unclipped data
 
-        # Define WMO-standard SPI classification
-        spi_classes = [
-            [-float('inf'), -2.0, "Exceptional Drought"],
-            [-2.0, -1.5, "Extreme Drought"],
-            [-1.5, -1.0, "Severe Drought"],
-            [-1.0, -0.5, "Moderate Drought"],
-            [-0.5, 0.5, "Near Normal"],
-            [0.5, 1.0, "Moderately Wet"],
-            [1.0, 1.5, "Very Wet"],
-            [1.5, 2.0, "Extremely Wet"],
-            [2.0, float('inf'), "Exceptionally Wet"]
-        ]
-
-        # Create meshgrid for proper hover alignment
-        lon_mesh, lat_mesh = np.meshgrid(spi_clipped.lon.values, spi_clipped.lat.values)
-        
-        # Prepare hover text as 2D array
-        hover_text = np.empty_like(spi_clipped.values, dtype=object)
-        for i in range(spi_clipped.values.shape[0]):
-            for j in range(spi_clipped.values.shape[1]):
-                z = spi_clipped.values[i,j]
-                if np.isnan(z):
-                    hover_text[i,j] = "No data"
-                    continue
-                    
-                class_name = next((cls[2] for cls in spi_classes if cls[0] <= z < cls[1]), "N/A")
-                hover_text[i,j] = (
-                    f"SPI-{spi_type}: {z:.2f}<br>"
-                    f"Class: {class_name}<br>"
-                    f"Lat: {lat_mesh[i,j]:.2f}°<br>"
-                    f"Lon: {lon_mesh[i,j]:.2f}°"
-                )
+        # Classify every pixel against the SPI_CLASSES edges; the hover shows the numbered class of the colorbar
+        spi_values = spi_clipped.values
+        class_edges = [spi_class[1] for spi_class in SPI_CLASSES[:-1]]
+        spi_class = (np.digitize(spi_values, class_edges) + 1).astype(np.uint8)
+        class_colorscale, class_midpoints = spi_class_colorscale()
 
         # Create figure
                # Create figure with map and table
@@ -2011,27 +2938,22 @@ def update_drought_analysis(spi_type, year, month):
             go.Heatmap(
                 x=spi_clipped.lon.values,
                 y=spi_clipped.lat.values,
-                z=spi_clipped.values,
-                colorscale=[
-                    [0.00, "#730000"], [0.12, "#E60000"], 
-                    [0.25, "#FFAA00"], [0.37, "#FCD37F"],
-                    [0.50, "#FFFFFF"], [0.62, "#9AECFF"],
-                    [0.75, "#00AFFF"], [0.87, "#0064C8"],
-                    [1.00, "#0000FF"]
-                ],
-                zmin=-2.5,
-                zmax=2.5,
-                hoverinfo="text",
-                text=hover_text,
-                hovertemplate="%{text}<extra></extra>",
+                z=to_typed_array(spi_values),
+                colorscale=class_colorscale,
+                zmin=SPI_RANGE[0],
+                zmax=SPI_RANGE[1],
+                customdata=spi_class,
+                hoverongaps=False,
+                hovertemplate=(
+                    f"SPI-{spi_type}: %{{z:.2f}}<br>"
+                    "Class: %{customdata}<br>"
+                    "Lat: %{y:.2f}°<br>"
+                    "Lon: %{x:.2f}°<extra></extra>"
+                ),
                 colorbar=dict(
                     title=f'SPI-{spi_type} Scale',
-                    tickvals=[-2.0, -1.5, -1.0, -0.5, 0, 0.5, 1.0, 1.5, 2.0],
-                    ticktext=[
-                        "Exceptional Drought", "Extreme Drought", "Severe Drought", 
-                        "Moderate Drought", "Near Normal", "Moderately Wet", 
-                        "Very Wet", "Extremely Wet", "Exceptionally Wet"
-                    ]
+                    tickvals=class_midpoints,
+                    ticktext=[f"{code}. {name}" for code, (_, _, name) in enumerate(SPI_CLASSES, 1)]
                 )
             ),
             row=1, col=1
@@ -2050,9 +2972,8 @@ def update_drought_analysis(spi_type, year, month):
                     values=[
                         ["≤ -2.0", "-2.0 to -1.5", "-1.5 to -1.0", "-1.0 to -0.5", 
                          "-0.5 to 0.5", "0.5 to 1.0", "1.0 to 1.5", "1.5 to 2.0", "≥ 2.0"],
-                        ["Exceptional Drought", "Extreme Drought", "Severe Drought", 
-                         "Moderate Drought", "Near Normal", "Moderately Wet", 
-                         "Very Wet", "Extremely Wet", "Exceptionally Wet"],
+                        # Numbered like the colorbar, which the map hover's class code refers to
+                        [f"{code}. {name}" for code, (_, _, name) in enumerate(SPI_CLASSES, 1)],
                         ["", "", "", "", "", "", "", "", ""]  # Empty for color boxes
                     ],
                     fill_color=[
@@ -2094,6 +3015,129 @@ def update_drought_analysis(spi_type, year, month):
             annotations=[dict(text=str(e), showarrow=False)]
         )
 
+@app.callback(
+    [Output('spi-pixel-plot', 'figure'),
+     Output('spi-pixel-plot', 'style')],
+    [Input('spi-spatial-plot', 'clickData')],
+    [State('spi-selector', 'value')],
+    prevent_initial_call=True
+)
+def update_spi_pixel_series(click_data, spi_type):
+    # Only heatmap points carry coordinates; clicks on the class table have none
+    point = click_data['points'][0] if click_data else {}
+    if spi_type is None or 'x' not in point or 'y' not in point:
+        raise PreventUpdate
+
+    spi_type = int(spi_type)
+    result = pixel_series(get_pixel_major('Monthly'), point['y'], point['x'])
+    if result is None:
+        raise PreventUpdate
+    precipitation, (lat, lon) = result
+
+    # The map being clicked has normally stored this timescale already; otherwise fit this pixel alone,
+    # with the same kernel and calibration years as the stored cubes
+    spi_cube = read_spi(spi_type, CHIRPS_PREPROCESSING.MERGED_FILE)
+    if spi_cube is not None:
+        spi = spi_cube.sel(lat=lat, lon=lon, method='nearest').values
+    else:
+        years = precipitation.index.year
+        spi = spi_series(precipitation.values.astype(np.float64), spi_type, int(years[0]), int(years[-1]))
+
+    fig = plot_pixel_series(
+        x=precipitation.index,
+        y=spi,
+        legend=f'SPI-{spi_type}',
+        hovertemplate=f'<b>Month</b>: %{{x|%B %Y}}<br><b>SPI-{spi_type}</b>: %{{y:.2f}}<extra></extra>',
+        title=f"<b>SPI-{spi_type} at {lat:.3f}°N, {lon:.3f}°E</b><br>Full Record",
+        yaxis=f'SPI-{spi_type}'
+    )
+    return fig, {'display': 'block'}
+
+@app.callback(
+    [Output('drought-event-table', 'data'),
+     Output('drought-event-table', 'selected_rows'),
+     Output('drought-event-tracks', 'data')],
+    [Input('spi-selector', 'value')],
+    background=True,
+    progress=[Output('drought-events-progress', 'value'),
+              Output('drought-events-progress', 'max')],
+    running=[(Output('drought-events-progress', 'style'), {'display': 'flex'}, {'display': 'none'})]
+)
+def update_drought_events(set_progress, spi_type):
+    if spi_type is None:
+        raise PreventUpdate
+
+    spi_da = get_spi_cube(int(spi_type), progress=job_progress(set_progress))
+    events = detect_drought_events(clip_to_nepal(spi_da, all_touched=True))
+
+    # Tracks stay out of the table; rows and tracks share their position in the catalog
+    tracks = [
+        [[f"{month:%B %Y}", float(lat), float(lon), float(area)] for month, lat, lon, area in track]
+        for track in events['track']
+    ]
+    table = events.drop(columns='track')
+    for column in ('onset', 'end', 'peak_date'):
+        table[column] = pd.to_datetime(table[column]).dt.strftime('%Y-%m')
+    return table.to_dict('records'), [], tracks
+
+@app.callback(
+    [Output('drought-event-track', 'figure'),
+     Output('drought-event-track', 'style')],
+    [Input('drought-event-table', 'selected_rows')],
+    [State('drought-event-table', 'data'),
+     State('drought-event-tracks', 'data'),
+     State('spi-selector', 'value')],
+    prevent_initial_call=True
+)
+def update_drought_event_track(selected_rows, rows, tracks, spi_type):
+    if not selected_rows or not tracks:
+        return go.Figure(), {'display': 'none'}
+
+    row = selected_rows[0]
+    event = rows[row]
+    dates, lat, lon, area = zip(*tracks[row])
+    fig = plot_event_track(
+        lat=lat,
+        lon=lon,
+        area=area,
+        dates=dates,
+        title=f"<b>SPI-{spi_type} Drought Event {event['onset']} to {event['end']}</b><br>"
+              f"Monthly Centroid Track (peak SPI {event['peak_spi']:.2f} in {event['peak_date']})"
+    )
+    return fig, {'display': 'block'}
+
+# Share of the country in each SPI class per month, persisted per SPI scale and data version
+@app.callback(
+    Output('drought-area-plot', 'figure'),
+    [Input('spi-selector', 'value')],
+    background=True,
+    progress=[Output('drought-area-progress', 'value'),
+              Output('drought-area-progress', 'max')],
+    running=[(Output('drought-area-progress', 'style'), {'display': 'flex'}, {'display': 'none'})]
+)
+def update_drought_area(set_progress, spi_type):
+    if spi_type is None:
+        raise PreventUpdate
+    spi_type = int(spi_type)
+
+    class_edges = [spi_class[1] for spi_class in SPI_CLASSES[:-1]]
+    class_names = [spi_class[2] for spi_class in SPI_CLASSES]
+    fractions = load_class_area_fractions(
+        f"spi{spi_type}",
+        lambda: class_area_fractions(
+            get_spi_cube(spi_type, progress=job_progress(set_progress)),
+            class_edges, class_names, get_area_weights()
+        ),
+        CHIRPS_PREPROCESSING.MERGED_FILE
+    )
+
+    return plot_class_area(
+        x=fractions['time'].values,
+        fractions={name: fractions.sel(spi_class=name).values for name in class_names},
+        colors=[color for _, color in SPI_COLORSCALE],
+        title=f"<b>Share of Nepal in Each SPI-{spi_type} Class</b><br>Area-weighted, per month"
+    )
+
 # In your main application file (app.py or similar)
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 8080))
@@ -0,0 +1,16 @@
+import numpy as np
+import pymannkendall as mk
+
+from Analysis.spatial_trend import trend_test
+
+
+def test_single_series_matches_pymannkendall():
+    # Long enough that the streamed Sen's slope selects its median from a sampled bracket
+    rng = np.random.default_rng(0)
+    values = rng.gamma(2.0, 3.0, 2000) + np.arange(2000) * 0.002
+    values[rng.random(2000) < 0.05] = np.nan
+
+    result, expected = trend_test(values), mk.original_test(values)
+    assert result.trend == expected.trend
+    np.testing.assert_allclose(result.slope, expected.slope, rtol=1e-12)
+    np.testing.assert_allclose(result.p, expected.p, rtol=1e-9)
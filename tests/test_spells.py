@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from Analysis.spells import compute_spells, store_dry_spells
+from Analysis.wet_day_store import build_wet_day_store
+
+
+def _daily_cube():
+    # Two years on a 3x4 grid: mostly dry days, scattered wet and sub-threshold days, missing days
+    # inside the record, one pixel outside the border and one missing for all of the first year
+    time = pd.date_range("2000-01-01", "2001-12-31", freq="D")
+    rng = np.random.default_rng(0)
+    values = np.where(rng.random((len(time), 3, 4)) < 0.3, rng.gamma(0.8, 6.0, (len(time), 3, 4)), 0.0)
+    values[rng.random(values.shape) < 0.02] = np.nan
+    values[:, 0, 0] = np.nan
+    values[:366, 1, 2] = np.nan
+    values[:, 2, 3] = 0.0  # Never wet
+    return xr.DataArray(values, coords={'time': time, 'lat': [27.0, 27.05, 27.1], 'lon': [84.0, 84.05, 84.1, 84.15]},
+                        dims=('time', 'lat', 'lon'), name='tp')
+
+
+def test_store_dry_spells_match_dense():
+    daily = _daily_cube()
+    store = build_wet_day_store(daily)
+    for min_length in (1, 5):
+        xr.testing.assert_allclose(store_dry_spells(store, min_length=min_length),
+                                   compute_spells(daily, 'dry', min_length=min_length))
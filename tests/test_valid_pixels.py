@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from Analysis.valid_pixels import valid_pixel_index, compress, regrid
+
+
+def _daily_cube():
+    # 3x4 grid with the corner cells outside the border (NaN on every day)
+    time = pd.date_range("2000-01-01", "2000-03-31", freq="D")
+    values = np.random.default_rng(0).gamma(1.0, 5.0, size=(len(time), 3, 4))
+    values[:, 0, 0] = np.nan
+    values[:, 2, 3] = np.nan
+    return xr.DataArray(values, coords={'time': time, 'lat': [27.0, 27.05, 27.1], 'lon': [84.0, 84.05, 84.1, 84.15]},
+                        dims=('time', 'lat', 'lon'), name='tp')
+
+
+def test_resampled_cube_keeps_daily_footprint():
+    daily = _daily_cube()
+    monthly = daily.resample(time='1ME').sum(skipna=True, min_count=1)
+
+    np.testing.assert_array_equal(valid_pixel_index(monthly), valid_pixel_index(daily))
+    assert len(valid_pixel_index(monthly)) == 10
+
+
+def test_compress_regrid_round_trip_on_resampled_cube():
+    monthly = _daily_cube().resample(time='1ME').sum(skipna=True, min_count=1)
+    compact = compress(monthly)
+
+    assert compact['values'].shape == (3, 10)
+    assert not np.isnan(compact['values']).any()
+
+    restored = regrid(compact, compact['values'], dims=['time'], coords={'time': monthly['time']})
+    np.testing.assert_array_equal(restored.values, monthly.values)
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+
+def _as_numeric(x):
+    x = pd.Series(x)
+    if pd.api.types.is_datetime64_any_dtype(x):
+        return x.astype('int64').to_numpy(dtype=np.float64)
+    return x.to_numpy(dtype=np.float64)
+
+
+def lttb_indices(x, y, n_out):
+    """Indices of the points kept by largest-triangle-three-buckets downsampling"""
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # Bucket edges for the n - 2 interior points; first and last points are always kept
+    edges = (np.floor(np.arange(n_out - 1) * (n - 2) / (n_out - 2)) + 1).astype(int)
+    edges[-1] = n - 1
+
+    indices = np.empty(n_out, dtype=int)
+    indices[0] = 0
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = edges[i + 1], (edges[i + 2] if i + 2 < len(edges) else n)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        # Keep the bucket point forming the largest triangle with the previous pick and the next bucket mean
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        indices[i + 1] = a
+
+    indices[-1] = n - 1
+    return indices
+
+
+def downsample_series(x, y, n_out):
+    """Downsample an (x, y) series to at most n_out points, dropping NaN values first"""
+    x = pd.Series(x).reset_index(drop=True)
+    y = pd.Series(y).reset_index(drop=True)
+    if len(y) <= n_out:
+        return x, y
+
+    valid = y.notna()
+    x, y = x[valid].reset_index(drop=True), y[valid].reset_index(drop=True)
+    indices = lttb_indices(_as_numeric(x), y.to_numpy(dtype=np.float64), n_out)
+    return x.iloc[indices], y.iloc[indices]
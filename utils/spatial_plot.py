@@ -2,65 +2,121 @@ import geopandas as gpd
 import plotly.graph_objects as go
 import numpy as np
 import plotly.express as px
+from dash import Patch
+from functools import lru_cache
 
 # Load the shapefile outside the function (only once)
 shapefile_path = 'Shapefile/Nepal_bnd_WGS84.shp'
 nepal_shape = gpd.read_file(shapefile_path)
 
-def plot_precipitation_distribution(z, x, y, colorbar, hovertemplate, title, title2):
-    fig_spatial = go.Figure()
-    
-    # Add Heatmap
-    fig_spatial.add_trace(go.Heatmap(
-        z=z,
-        x=x,
-        y=y,
-        colorscale='YlGnBu',
-        colorbar=dict(title=colorbar),
-        hovertemplate=hovertemplate,
-        name="Precipitation"
-    ))
+# Size of every map figure, and the part of it left to the heatmap after margins and colorbar
+MAP_WIDTH = 1250
+MAP_HEIGHT = 700
+MAP_PLOT_AREA = (MAP_WIDTH - 260, MAP_HEIGHT - 180)
+
+def to_typed_array(values):
+    """Cast grid values to float32 so Plotly ships them as a compact base64 typed array (NaN kept)"""
+    return np.asarray(values, dtype=np.float32)
+
+@lru_cache(maxsize=None)
+def nepal_boundary_traces():
+    """Nepal outline traces, built once and shared by every map"""
+    traces = []
 
     # Add Nepal shapefile outline
     try:
         # Convert to GeoJSON
         nepal_geojson = nepal_shape.__geo_interface__
-        
+
         for feature in nepal_geojson['features']:
             coords = feature['geometry']['coordinates']
-            
+
             if feature['geometry']['type'] == 'MultiPolygon':
-                for polygon in coords:
-                    for ring in polygon:
-                        lon, lat = zip(*ring)
-                        fig_spatial.add_trace(go.Scatter(
-                            x=lon,
-                            y=lat,
-                            mode='lines',
-                            line=dict(color='black', width=2),
-                            hoverinfo='skip',
-                            showlegend=False
-                        ))
+                rings = [ring for polygon in coords for ring in polygon]
             else:  # Polygon
-                for ring in coords:
-                    lon, lat = zip(*ring)
-                    fig_spatial.add_trace(go.Scatter(
-                        x=lon,
-                        y=lat,
-                        mode='lines',
-                        line=dict(color='black', width=2),
-                        hoverinfo='skip',
-                        showlegend=False
-                    ))
+                rings = coords
+
+            for ring in rings:
+                lon, lat = zip(*ring)
+                traces.append(go.Scatter(
+                    x=to_typed_array(lon),
+                    y=to_typed_array(lat),
+                    mode='lines',
+                    line=dict(color='black', width=2),
+                    hoverinfo='skip',
+                    showlegend=False
+                ))
     except Exception as e:
         print(f"Could not add shapefile: {e}")
 
-    # Format axes
+    return tuple(traces)
+
+@lru_cache(maxsize=None)
+def nepal_boundary_map_traces():
+    """Nepal outline traces for tile (MapLibre) maps"""
+    return tuple(
+        go.Scattermap(
+            lon=trace.x,
+            lat=trace.y,
+            mode='lines',
+            line=dict(color='black', width=2),
+            hoverinfo='skip',
+            showlegend=False
+        )
+        for trace in nepal_boundary_traces()
+    )
+
+def spatial_axes(x, y):
+    """Longitude/latitude axis layouts with five degree-formatted ticks"""
     x_tickvals = np.linspace(min(x), max(x), 5)
     x_ticktext = [f"{abs(val):.1f}°{'E' if val >= 0 else 'W'}" for val in x_tickvals]
     y_tickvals = np.linspace(min(y), max(y), 5)
     y_ticktext = [f"{abs(val):.1f}°{'N' if val >= 0 else 'S'}" for val in y_tickvals]
 
+    xaxis = dict(
+        title='Longitude',
+        tickvals=x_tickvals,
+        ticktext=x_ticktext,
+        tickfont=dict(size=12),
+        showgrid=True,
+        gridcolor='lightgrey'
+    )
+    yaxis = dict(
+        title='Latitude',
+        tickvals=y_tickvals,
+        ticktext=y_ticktext,
+        tickfont=dict(size=12),
+        showgrid=True,
+        gridcolor='lightgrey'
+    )
+    return xaxis, yaxis
+
+def patch_spatial_figure(fig):
+    """Patch that swaps only the heatmap trace and title of a map already on screen for those of fig"""
+    patched_fig = Patch()
+    patched_fig['data'][0] = fig.data[0]
+    patched_fig['layout']['title']['text'] = fig.layout.title.text
+    return patched_fig
+
+def plot_precipitation_distribution(z, x, y, colorbar, hovertemplate, title, title2):
+    fig_spatial = go.Figure()
+
+    # Add Heatmap
+    fig_spatial.add_trace(go.Heatmap(
+        z=to_typed_array(z),
+        x=x,
+        y=y,
+        colorscale='YlGnBu',
+        colorbar=dict(title=colorbar),
+        hovertemplate=hovertemplate,
+        name="Precipitation"
+    ))
+
+    fig_spatial.add_traces(nepal_boundary_traces())
+
+    # Format axes
+    xaxis, yaxis = spatial_axes(x, y)
+
     fig_spatial.update_layout(
         title={
             'text': title,
@@ -68,25 +124,94 @@ def plot_precipitation_distribution(z, x, y, colorbar, hovertemplate, title, tit
             'xanchor': 'center',
             'font': dict(size=18, family="Arial Black", color='MidnightBlue')
         },
-        xaxis=dict(
-            title='Longitude',
-            tickvals=x_tickvals,
-            ticktext=x_ticktext,
-            tickfont=dict(size=12),
-            showgrid=True,
-            gridcolor='lightgrey'
+        xaxis=xaxis,
+        yaxis=yaxis,
+        plot_bgcolor='rgba(240,248,255, 0.4)',
+        width=MAP_WIDTH,
+        height=MAP_HEIGHT,
+    )
+
+    return fig_spatial
+
+def plot_tile_map(tile_url, colorscale, cmin, cmax, colorbar, title, center, zoom):
+    """Pannable map drawing the raster tiles at tile_url ({z}/{x}/{y} placeholders) over a basemap"""
+    # Raster layers have no legend, so an invisible marker carries the colorbar
+    fig_map = go.Figure(go.Scattermap(
+        lat=[center['lat']],
+        lon=[center['lon']],
+        mode='markers',
+        marker=dict(
+            size=0,
+            color=[cmin],
+            colorscale=colorscale,
+            cmin=cmin,
+            cmax=cmax,
+            showscale=True,
+            colorbar=dict(title=colorbar)
+        ),
+        hoverinfo='skip',
+        showlegend=False
+    ))
+
+    fig_map.add_traces(nepal_boundary_map_traces())
+
+    fig_map.update_layout(
+        title={
+            'text': title,
+            'x': 0.5,
+            'xanchor': 'center',
+            'font': dict(size=18, family="Arial Black", color='MidnightBlue')
+        },
+        map=dict(
+            style='carto-positron',
+            center=center,
+            zoom=zoom,
+            layers=[dict(sourcetype='raster', source=[tile_url], below='traces', opacity=0.85)]
         ),
-        yaxis=dict(
-            title='Latitude',
-            tickvals=y_tickvals,
-            ticktext=y_ticktext,
-            tickfont=dict(size=12),
-            showgrid=True,
-            gridcolor='lightgrey'
+        width=MAP_WIDTH,
+        height=MAP_HEIGHT,
+    )
+
+    return fig_map
+
+def plot_event_track(lat, lon, area, dates, title):
+    """Monthly centroid path of a drought event over the Nepal outline, markers sized and coloured by area"""
+    area = np.asarray(area)
+    fig_track = go.Figure()
+
+    fig_track.add_traces(nepal_boundary_traces())
+
+    fig_track.add_trace(go.Scatter(
+        x=lon,
+        y=lat,
+        mode='lines+markers',
+        line=dict(color='grey', width=1, dash='dot'),
+        marker=dict(
+            size=8 + 22 * np.sqrt(area / area.max()),
+            color=area,
+            colorscale='OrRd',
+            colorbar=dict(title='Area (km²)'),
+            line=dict(width=1, color='black')
         ),
+        customdata=list(zip(dates, area.tolist())),
+        hovertemplate='<b>%{customdata[0]}</b><br>Lat: %{y:.2f}°<br>Lon: %{x:.2f}°<br>Area: %{customdata[1]:,.0f} km²<extra></extra>',
+        showlegend=False
+    ))
+
+    xaxis, yaxis = spatial_axes(nepal_shape.total_bounds[[0, 2]], nepal_shape.total_bounds[[1, 3]])
+
+    fig_track.update_layout(
+        title={
+            'text': title,
+            'x': 0.5,
+            'xanchor': 'center',
+            'font': dict(size=18, family="Arial Black", color='MidnightBlue')
+        },
+        xaxis=xaxis,
+        yaxis=yaxis,
         plot_bgcolor='rgba(240,248,255, 0.4)',
-        width=1250,
-        height=700,
+        width=MAP_WIDTH,
+        height=MAP_HEIGHT,
     )
 
-    return fig_spatial
\ No newline at end of file
+    return fig_track
@@ -1,93 +1,116 @@
-import geopandas as gpd
-import plotly.graph_objects as go
 import numpy as np
+import plotly.graph_objects as go
+from utils.spatial_plot import to_typed_array, nepal_boundary_traces, spatial_axes, MAP_WIDTH, MAP_HEIGHT
 
-# Load the shapefile outside the function (only once)
-shapefile_path = 'Shapefile/Nepal_bnd_WGS84.shp'
-nepal_shape = gpd.read_file(shapefile_path)
-
-def spatial_trend_plot(dataset,a):
+def spatial_trend_plot(dataset,a,preview=False,test_name='Mann-Kendall Test'):
     fig_spatial_trend = go.Figure()
 
     fig_spatial_trend.add_trace(go.Heatmap(
         x=dataset.lon.values,
         y=dataset.lat.values,
-        z=dataset.values,
+        z=to_typed_array(dataset.values),
         colorscale='RdBu',
         colorbar=dict(title=f'Slope (mm/{a})'),
         hovertemplate="Lat: %{y:.2f}<br>Lon: %{x:.2f}<br>Trend: %{z:.2f} mm/" + str(a),
         name='Mann-Kendall Trend Slope (mm/yr)'
     ))
 
-    # Get min and max of coordinates
-    x = dataset.lon.values
-    y = dataset.lat.values
-    
-    x_tickvals = np.linspace(min(x), max(x), 5)
-    y_tickvals = np.linspace(min(y), max(y), 5)
-
-    x_ticktext = [f"{abs(val):.1f}°{'E' if val >= 0 else 'W'}" for val in x_tickvals]
-    y_ticktext = [f"{abs(val):.1f}°{'N' if val >= 0 else 'S'}" for val in y_tickvals]
-
     # Add Nepal shapefile outline
-    try:
-        # Convert to GeoJSON
-        nepal_geojson = nepal_shape.__geo_interface__
-        
-        for feature in nepal_geojson['features']:
-            coords = feature['geometry']['coordinates']
-            
-            if feature['geometry']['type'] == 'MultiPolygon':
-                for polygon in coords:
-                    for ring in polygon:
-                        lon, lat = zip(*ring)
-                        fig_spatial_trend.add_trace(go.Scatter(
-                            x=lon,
-                            y=lat,
-                            mode='lines',
-                            line=dict(color='black', width=2),
-                            hoverinfo='skip',
-                            showlegend=False
-                        ))
-            else:  # Polygon
-                for ring in coords:
-                    lon, lat = zip(*ring)
-                    fig_spatial_trend.add_trace(go.Scatter(
-                        x=lon,
-                        y=lat,
-                        mode='lines',
-                        line=dict(color='black', width=2),
-                        hoverinfo='skip',
-                        showlegend=False
-                    ))
-    except Exception as e:
-        print(f"Could not add shapefile: {e}")
+    fig_spatial_trend.add_traces(nepal_boundary_traces())
+
+    xaxis, yaxis = spatial_axes(dataset.lon.values, dataset.lat.values)
 
+    title = f'Spatial Distribution of Statistically Significant Precipitation Trends (p <= 0.05) <br>  Derived from {test_name}'
+    if preview:
+        title += '<br><sub>Preview on a coarser grid, full resolution loading...</sub>'
 
     fig_spatial_trend.update_layout(
-        title=dict(text='Spatial Distribution of Statistically Significant Precipitation Trends (p <= 0.05) <br>  Derived from Mann-Kendall Test',
+        title=dict(text=title,
+                   xanchor='center',
+                   x=0.5,
+                   font=dict(size=18, family="Arial Black", color='MidnightBlue')),
+        xaxis=xaxis,
+        yaxis=yaxis,
+        plot_bgcolor='rgba(240,248,255, 0.4)',
+        width=MAP_WIDTH,
+        height=MAP_HEIGHT
+    )
+
+    return fig_spatial_trend
+
+def changepoint_plot(changepoint):
+    fig_changepoint = go.Figure()
+
+    change_year = changepoint['change_year']
+    fig_changepoint.add_trace(go.Heatmap(
+        x=change_year.lon.values,
+        y=change_year.lat.values,
+        z=to_typed_array(change_year.values),
+        customdata=to_typed_array(changepoint['p_value'].values),
+        colorscale='Viridis',
+        colorbar=dict(title='Change year'),
+        hovertemplate="Lat: %{y:.2f}<br>Lon: %{x:.2f}<br>Change year: %{z:.0f}<br>p-value: %{customdata:.3f}<extra></extra>",
+        name='Pettitt Change Year'
+    ))
+
+    fig_changepoint.add_traces(nepal_boundary_traces())
+
+    xaxis, yaxis = spatial_axes(change_year.lon.values, change_year.lat.values)
+
+    fig_changepoint.update_layout(
+        title=dict(text='Year of Statistically Significant Shift in Precipitation (p <= 0.05) <br>  Derived from Pettitt Test',
+                   xanchor='center',
+                   x=0.5,
+                   font=dict(size=18, family="Arial Black", color='MidnightBlue')),
+        xaxis=xaxis,
+        yaxis=yaxis,
+        plot_bgcolor='rgba(240,248,255, 0.4)',
+        width=MAP_WIDTH,
+        height=MAP_HEIGHT
+    )
+
+    return fig_changepoint
+
+def trend_interval_plot(intervals, a, display='trend_ci'):
+    fig_intervals = go.Figure()
+
+    confidence = int(round(float(intervals.attrs['confidence']) * 100))
+    slope = intervals['slope']
+    if display == 'trend_ci':
+        z, colorscale, colorbar = intervals['ci_width'], 'Viridis', f'CI width (mm/{a})'
+        hover_label = f"{confidence}% CI width"
+        title = f"Width of the {confidence}% Confidence Interval of Precipitation Trends <br>  Block-Bootstrap Sen's Slope"
+    else:
+        z, colorscale, colorbar = intervals['robust_slope'], 'RdBu', f'Slope (mm/{a})'
+        hover_label = 'Trend'
+        title = f"Robustly Significant Precipitation Trends ({confidence}% CI excludes zero) <br>  Block-Bootstrap Sen's Slope"
+
+    fig_intervals.add_trace(go.Heatmap(
+        x=slope.lon.values,
+        y=slope.lat.values,
+        z=to_typed_array(z.values),
+        customdata=np.stack([intervals['lower'].values, intervals['upper'].values], axis=-1),
+        colorscale=colorscale,
+        colorbar=dict(title=colorbar),
+        hovertemplate=("Lat: %{y:.2f}<br>Lon: %{x:.2f}<br>" + hover_label + ": %{z:.2f} mm/" + str(a)
+                       + "<br>CI: %{customdata[0]:.2f} to %{customdata[1]:.2f}<extra></extra>"),
+        name="Sen's Slope Confidence Interval"
+    ))
+
+    fig_intervals.add_traces(nepal_boundary_traces())
+
+    xaxis, yaxis = spatial_axes(slope.lon.values, slope.lat.values)
+
+    fig_intervals.update_layout(
+        title=dict(text=title,
                    xanchor='center',
                    x=0.5,
                    font=dict(size=18, family="Arial Black", color='MidnightBlue')),
-        xaxis=dict(
-            title='Longitude',
-            tickvals=x_tickvals,
-            ticktext=x_ticktext,
-            tickfont=dict(size=12),
-            showgrid=True,
-            gridcolor='lightgrey'
-        ),
-        yaxis=dict(
-            title='Latitude',
-            tickvals=y_tickvals,
-            ticktext=y_ticktext,
-            tickfont=dict(size=12),
-            showgrid=True,
-            gridcolor='lightgrey'
-        ),
+        xaxis=xaxis,
+        yaxis=yaxis,
         plot_bgcolor='rgba(240,248,255, 0.4)',
-        width=1250,
-        height=700
+        width=MAP_WIDTH,
+        height=MAP_HEIGHT
     )
 
-    return fig_spatial_trend
\ No newline at end of file
+    return fig_intervals
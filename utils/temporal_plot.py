@@ -1,10 +1,26 @@
 import plotly.graph_objects as go
 import pymannkendall as mk
+from utils.downsample import downsample_series
 
-def plot_precipitation_trend(x,y, legend, hovertemplate, title, yaxis, y_max, y_min, y_pad, mk_result,unit):
-    fig = go.Figure()
+# Long series are downsampled to this many points before being sent to the browser
+MAX_POINTS = 2000
+# Above this many points the trace is drawn with WebGL and without markers
+WEBGL_THRESHOLD = 1000
+
+def trend_trace(x, y, legend, hovertemplate):
+    x, y = downsample_series(x, y, MAX_POINTS)
 
-    fig.add_trace(go.Scatter(
+    if len(y) > WEBGL_THRESHOLD:
+        return go.Scattergl(
+            x=x,
+            y=y,
+            mode='lines',
+            name=legend,
+            line=dict(color='royalblue', width=2),
+            hovertemplate=hovertemplate
+        )
+
+    return go.Scatter(
         x= x,
         y=y,
         mode='lines+markers',
@@ -12,7 +28,12 @@ def plot_precipitation_trend(x,y, legend, hovertemplate, title, yaxis, y_max, y_
         line=dict(color='royalblue', width=3),
         marker=dict(size=8, color='white', line=dict(width=2, color='darkblue')),
         hovertemplate=hovertemplate
-    ))
+    )
+
+def plot_precipitation_trend(x,y, legend, hovertemplate, title, yaxis, y_max, y_min, y_pad, mk_result,unit, test_name='Mann-Kendall Test'):
+    fig = go.Figure()
+
+    fig.add_trace(trend_trace(x, y, legend, hovertemplate))
 
     fig.update_layout(
         title={
@@ -57,7 +78,7 @@ def plot_precipitation_trend(x,y, legend, hovertemplate, title, yaxis, y_max, y_
                 xref='paper',
                 yref='paper',
                 text=(
-                    f"<b>Mann-Kendall Test</b><br>"
+                    f"<b>{test_name}</b><br>"
                     f"Trend: <i>{mk_result.trend}</i><br>"
                     f"Slope: { mk_result.slope:.2f} {unit}<br>"
                     f"p-value: { mk_result.p:.2f}"
@@ -75,3 +96,85 @@ def plot_precipitation_trend(x,y, legend, hovertemplate, title, yaxis, y_max, y_
         height=700,
     )
     return fig
+
+def plot_pixel_series(x, y, legend, hovertemplate, title, yaxis):
+    """Full record of one map pixel, downsampled like the area-mean trend plot"""
+    fig = go.Figure(trend_trace(x, y, legend, hovertemplate))
+
+    fig.update_layout(
+        title={
+            'text': title,
+            'x': 0.5,
+            'xanchor': 'center',
+            'font': dict(size=16, family="Arial Black", color='MidnightBlue')
+        },
+        xaxis=dict(
+            title=dict(text='Year', font=dict(size=14, family="Arial Black", color='black')),
+            showgrid=True,
+            gridcolor='lightgrey',
+            showline=True,
+            linecolor='grey',
+            ticks='outside'
+        ),
+        yaxis=dict(
+            title=dict(text=yaxis, font=dict(size=14, family="Arial Black", color='black')),
+            showgrid=True,
+            gridcolor='lightgrey',
+            showline=True,
+            linecolor='grey',
+            ticks='outside'
+        ),
+        plot_bgcolor='rgba(240,248,255, 0.4)',
+        paper_bgcolor='white',
+        width=1250,
+        height=400,
+    )
+    return fig
+
+def plot_class_area(x, fractions, colors, title):
+    """Stacked area chart of the percentage of the country in each class; fractions maps class name -> series"""
+    fig = go.Figure()
+
+    for (name, values), color in zip(fractions.items(), colors):
+        fig.add_trace(go.Scatter(
+            x=x,
+            y=[100 * value for value in values],
+            mode='lines',
+            name=name,
+            stackgroup='classes',
+            line=dict(width=0.5, color='grey'),
+            fillcolor=color,
+            hovertemplate=f'<b>{name}</b>: %{{y:.1f}}%<extra></extra>'
+        ))
+
+    fig.update_layout(
+        title={
+            'text': title,
+            'x': 0.5,
+            'xanchor': 'center',
+            'font': dict(size=18, family="Arial Black", color='MidnightBlue')
+        },
+        xaxis=dict(
+            title=dict(text='Year', font=dict(size=16, family="Arial Black", color='black')),
+            showgrid=True,
+            gridcolor='lightgrey',
+            showline=True,
+            linecolor='grey',
+            ticks='outside'
+        ),
+        yaxis=dict(
+            title=dict(text='Area of Nepal (%)', font=dict(size=16, family="Arial Black", color='black')),
+            range=[0, 100],
+            showgrid=True,
+            gridcolor='lightgrey',
+            showline=True,
+            linecolor='grey',
+            ticks='outside'
+        ),
+        hovermode='x unified',
+        plot_bgcolor='rgba(240,248,255, 0.4)',
+        paper_bgcolor='white',
+        width=1250,
+        height=500,
+    )
+    return fig
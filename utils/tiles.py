@@ -0,0 +1,82 @@
+import struct
+import zlib
+from functools import lru_cache
+import numpy as np
+from plotly.colors import sample_colorscale
+
+TILE_SIZE = 256
+
+
+@lru_cache(maxsize=None)
+def colormap_lut(colorscale):
+    """256-entry RGB lookup table sampled from a Plotly colorscale name, or a tuple of (position, color) pairs"""
+    if not isinstance(colorscale, str):
+        colorscale = [list(stop) for stop in colorscale]
+    colors = sample_colorscale(colorscale, np.linspace(0, 1, 256), colortype='tuple')
+    return np.rint(np.array(colors) * 255).astype(np.uint8)
+
+
+def tile_pixel_centres(z, x, y):
+    """Longitudes and latitudes of the pixel centres of Web Mercator (XYZ) tile z/x/y"""
+    offsets = (np.arange(TILE_SIZE) + 0.5) / TILE_SIZE
+    n = 2 ** z
+    lon = (x + offsets) / n * 360.0 - 180.0
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (y + offsets) / n))))
+    return lon, lat
+
+
+def _grid_indices(centres, axis_values):
+    # Nearest cell of a regular (ascending or descending) axis, -1 where outside it
+    step = axis_values[1] - axis_values[0]
+    index = np.rint((centres - axis_values[0]) / step).astype(np.int64)
+    index[(index < 0) | (index >= len(axis_values))] = -1
+    return index
+
+
+def render_tile_rgba(values, lat, lon, z, x, y, colorscale, vmin, vmax):
+    """RGBA pixels of one tile, sampled nearest-neighbour from a (lat, lon) grid; NaN and off-grid are transparent"""
+    tile_lon, tile_lat = tile_pixel_centres(z, x, y)
+    rows = _grid_indices(tile_lat, lat)
+    cols = _grid_indices(tile_lon, lon)
+
+    sampled = values[np.ix_(rows, cols)]
+    sampled[rows < 0, :] = np.nan
+    sampled[:, cols < 0] = np.nan
+
+    scaled = (sampled - vmin) / (vmax - vmin) if vmax > vmin else np.zeros_like(sampled)
+    lut_index = np.rint(np.clip(np.nan_to_num(scaled), 0, 1) * 255).astype(np.uint8)
+
+    rgba = np.empty((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8)
+    rgba[..., :3] = colormap_lut(colorscale)[lut_index]
+    rgba[..., 3] = np.where(np.isnan(sampled), 0, 255)
+    return rgba
+
+
+def _png_chunk(kind, payload):
+    return struct.pack('>I', len(payload)) + kind + payload + struct.pack('>I', zlib.crc32(kind + payload) & 0xFFFFFFFF)
+
+
+def encode_png(rgba):
+    """Encode an (height, width, 4) uint8 array as an 8-bit RGBA PNG"""
+    height, width = rgba.shape[:2]
+    # Each scanline starts with filter type 0 (none)
+    scanlines = np.zeros((height, width * 4 + 1), dtype=np.uint8)
+    scanlines[:, 1:] = rgba.reshape(height, width * 4)
+
+    return (
+        b'\x89PNG\r\n\x1a\n'
+        + _png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0))
+        + _png_chunk(b'IDAT', zlib.compress(scanlines.tobytes(), 6))
+        + _png_chunk(b'IEND', b'')
+    )
+
+
+@lru_cache(maxsize=None)
+def empty_tile():
+    """Fully transparent tile for requests outside every layer"""
+    return encode_png(np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8))
+
+
+def tile_resolution(z):
+    """Width in degrees of one pixel of a zoom-level z tile"""
+    return 360.0 / (TILE_SIZE * 2 ** z)